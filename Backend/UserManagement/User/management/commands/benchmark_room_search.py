@@ -0,0 +1,81 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from User.models import Room, User
+from User.search import search_rooms
+
+WORDS = [
+    'design', 'engineering', 'standup', 'marketing', 'support', 'sales', 'release', 'backend',
+    'frontend', 'mobile', 'hiring', 'random', 'planning', 'incident', 'product', 'research',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Time the rooms dashboard search with and without its trigram indexes on a synthetic room table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=1_000_000)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--terms', nargs='+', default=['standup', 'incident plan', 'ngineer', 'no-such-room'])
+        parser.add_argument('--keep', action='store_true', help="Commit the generated rooms instead of rolling back")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options['rooms'])
+                self.stdout.write(f"{'term':<16}{'mode':<10}{'mean ms':>10}{'p95 ms':>10}{'rows':>8}")
+                for term in options['terms']:
+                    # Sequential scan is what the unindexed icontains filter did
+                    for mode, indexed, backend in [('seqscan', False, 'basic'), ('basic', True, 'basic'), ('trigram', True, 'trigram')]:
+                        timings, rows = self.run(term, indexed, backend, options['iterations'])
+                        timings.sort()
+                        self.stdout.write(
+                            f"{term:<16}{mode:<10}{statistics.mean(timings):>10.2f}"
+                            f"{timings[int(len(timings) * 0.95) - 1]:>10.2f}{rows:>8}"
+                        )
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        owner = User.objects.create_user(email='benchmark-room-search@example.com', password=None, name='Benchmark')
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            # mod() rather than the % operator, which would need escaping in a parametrized query
+            cursor.execute(
+                f"""
+                INSERT INTO "{Room._meta.db_table}" (name, description, created_at, is_active, owner_id, message_count, last_seq)
+                SELECT
+                    initcap(w[1 + mod(i, n)]) || ' ' || w[1 + mod(i / 7, n)] || ' ' || i,
+                    'Room for ' || w[1 + mod(i / 13, n)] || ' and ' || w[1 + mod(i / 29, n)] || ' talk',
+                    now() - i * interval '1 second', true, %s, 0, 0
+                FROM generate_series(1, %s) AS i, (SELECT %s::text[] AS w, %s AS n) AS words
+                """,
+                [owner.id, count, WORDS, len(WORDS)],
+            )
+            cursor.execute(f'ANALYZE "{Room._meta.db_table}"')
+        self.stdout.write(f"Seeded {count} rooms in {time.perf_counter() - started:.1f}s")
+
+    def run(self, term, indexed, backend, iterations):
+        """Time the view's first page: the COUNT(*) PageNumberPagination runs plus the page itself"""
+        timings = []
+        with override_settings(ROOM_SEARCH_BACKEND=backend):
+            rooms = search_rooms(Room.objects.filter(is_active=True).order_by('-created_at', '-id'), term)
+            for _ in range(iterations):
+                with transaction.atomic():
+                    if not indexed:
+                        with connection.cursor() as cursor:
+                            cursor.execute('SET LOCAL enable_bitmapscan = off')
+                            cursor.execute('SET LOCAL enable_indexscan = off')
+                    started = time.perf_counter()
+                    rows = rooms.count()
+                    list(rooms.select_related('owner')[:6])
+                    timings.append((time.perf_counter() - started) * 1000)
+        return timings, rows
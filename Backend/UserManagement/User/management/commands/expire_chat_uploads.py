@@ -0,0 +1,63 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from User.models import Attachment
+from User.views import get_partial_upload_path, get_upload_expiry_cutoff
+
+
+class Command(BaseCommand):
+    help = "Delete uploads no message claimed within CHAT_UPLOAD_EXPIRY, with their stored and staging files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+
+    def handle(self, *args, **options):
+        cutoff = get_upload_expiry_cutoff()
+        stale = Attachment.objects.filter(message__isnull=True, created_at__lt=cutoff)
+        if options['dry_run']:
+            self.stdout.write(f"{stale.count()} expired uploads")
+            return
+
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                # Locked rows are mid-chunk or being claimed; a later run gets them.
+                # A claim blocked on our lock re-checks message IS NULL and skips them.
+                batch = list(stale.select_for_update(skip_locked=True).order_by('id')[:options['batch_size']])
+                if not batch:
+                    break
+                Attachment.objects.filter(id__in=[attachment.id for attachment in batch]).delete()
+                # Files go only once the rows are gone for good
+                transaction.on_commit(lambda batch=batch: self.remove_files(batch))
+            deleted += len(batch)
+
+        removed = self.remove_orphaned_parts(cutoff.timestamp())
+        self.stdout.write(f"Deleted {deleted} expired uploads and {removed} orphaned staging files")
+
+    def remove_files(self, attachments):
+        for attachment in attachments:
+            try:
+                if attachment.file:
+                    attachment.file.delete(save=False)
+                path = get_partial_upload_path(attachment)
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                self.stderr.write(f"Could not remove files of upload {attachment.id}: {e}")
+
+    def remove_orphaned_parts(self, cutoff):
+        """Staging files untouched since the cutoff, e.g. left behind by a deleted room"""
+        removed = 0
+        if not os.path.isdir(settings.CHAT_UPLOAD_TEMP_DIR):
+            return removed
+        with os.scandir(settings.CHAT_UPLOAD_TEMP_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith('.part') and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except OSError as e:
+                        self.stderr.write(f"Could not remove {entry.path}: {e}")
+        return removed
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-16 09:12
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('User', '0005_remove_room_participants'),
+    ]
+
+    operations = [
+        # Concurrently, so writes to the message table aren't blocked during the build
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(fields=['room', 'created_at', 'id'], name='message_room_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-16 10:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_message_count(apps, schema_editor):
+    Room = apps.get_model('User', 'Room')
+    Message = apps.get_model('User', 'Message')
+    counts = Message.objects.filter(room=OuterRef('pk')).order_by().values('room').annotate(
+        total=Count('id')
+    ).values('total')
+    Room.objects.update(message_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0006_message_message_room_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_message_count, migrations.RunPython.noop),
+    ]
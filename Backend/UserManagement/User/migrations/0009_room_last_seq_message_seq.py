@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-16 14:40
+
+from django.db import migrations, models
+
+
+def backfill_message_seq(apps, schema_editor):
+    """Number every room's messages by (created_at, id) and record the last number.
+
+    Two set-based statements, so the backfill is one pass over the message
+    table however many rows it has.
+    """
+    quote = schema_editor.quote_name
+    message = quote(apps.get_model('User', 'Message')._meta.db_table)
+    room = quote(apps.get_model('User', 'Room')._meta.db_table)
+    schema_editor.execute(f"""
+        UPDATE {message} AS m SET seq = numbered.n
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY room_id ORDER BY created_at, id) AS n
+            FROM {message}
+        ) AS numbered
+        WHERE m.id = numbered.id
+    """)
+    schema_editor.execute(f"""
+        UPDATE {room} AS r SET last_seq = numbered.last_seq
+        FROM (SELECT room_id, max(seq) AS last_seq FROM {message} GROUP BY room_id) AS numbered
+        WHERE r.id = numbered.room_id
+    """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0008_attachment_room_attachment_uploaded_by_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_message_seq, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-16 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('User', '0009_room_last_seq_message_seq'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False),
+        ),
+        # Build the unique index concurrently, then attach it as the constraint,
+        # so writes to the message table aren't blocked during the build
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "message_room_seq_uniq" ON "User_message" ("room_id", "seq");',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "message_room_seq_uniq";',
+                ),
+                migrations.RunSQL(
+                    sql='ALTER TABLE "User_message" ADD CONSTRAINT "message_room_seq_uniq" UNIQUE USING INDEX "message_room_seq_uniq";',
+                    reverse_sql='ALTER TABLE "User_message" DROP CONSTRAINT IF EXISTS "message_room_seq_uniq";',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='message',
+                    constraint=models.UniqueConstraint(fields=('room', 'seq'), name='message_room_seq_uniq'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-16 16:02
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently, BtreeGinExtension
+from django.db import migrations
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_search_vector(apps, schema_editor):
+    """Fill search_vector for existing messages in id ranges.
+
+    The migration is non-atomic, so every batch commits on its own. Row locks
+    are only held for one range at a time, and chat writes keep flowing.
+    Rows inserted since the trigger was created already have a vector.
+    """
+    message = schema_editor.quote_name(apps.get_model('User', 'Message')._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT min(id), max(id) FROM {message}")
+        first, last = cursor.fetchone()
+        if first is None:
+            return
+        for start in range(first, last + 1, BACKFILL_BATCH_SIZE):
+            cursor.execute(
+                f"""
+                UPDATE {message} SET search_vector = to_tsvector('pg_catalog.english', coalesce(message, ''))
+                WHERE id >= %s AND id < %s AND search_vector IS NULL
+                """,
+                [start, start + BACKFILL_BATCH_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('User', '0010_alter_message_seq_message_room_seq_uniq'),
+    ]
+
+    operations = [
+        BtreeGinExtension(),
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # A trigger rather than a save() hook, so bulk_create (write-behind) is covered too.
+        # UPDATE OF message: is_read and other column updates don't re-parse the text.
+        migrations.RunSQL(
+            sql="""
+                CREATE TRIGGER message_search_vector
+                BEFORE INSERT OR UPDATE OF message ON "User_message"
+                FOR EACH ROW EXECUTE FUNCTION
+                tsvector_update_trigger(search_vector, 'pg_catalog.english', message);
+            """,
+            reverse_sql='DROP TRIGGER IF EXISTS message_search_vector ON "User_message";',
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        # Concurrently, so writes to the message table aren't blocked during the build
+        AddIndexConcurrently(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['room', 'search_vector'], name='message_room_search_gin'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-16 16:40
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('User', '0011_message_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        # Concurrently, so writes to the room table aren't blocked during the build
+        AddIndexConcurrently(
+            model_name='room',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='room_name_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='room',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('description'), name='gin_trgm_ops'), name='room_description_trgm'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-16 17:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('User', '0012_room_trigram_indexes'),
+    ]
+
+    operations = [
+        # Concurrently, so writes to the room table aren't blocked during the build
+        AddIndexConcurrently(
+            model_name='room',
+            index=models.Index(fields=['is_active', 'created_at', 'id'], name='room_active_created_id_idx'),
+        ),
+    ]
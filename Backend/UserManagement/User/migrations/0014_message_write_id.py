@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-16 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('User', '0013_room_room_active_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='write_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        # Build the partial unique index without blocking writes to the message table
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "message_write_id_uniq" '
+                        'ON "User_message" ("write_id") WHERE "write_id" IS NOT NULL',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "message_write_id_uniq"',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='message',
+                    constraint=models.UniqueConstraint(
+                        condition=models.Q(('write_id__isnull', False)), fields=('write_id',), name='message_write_id_uniq'
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0014_message_write_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='upload_offset',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser,BaseUserManager
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models.functions import Greatest, Upper
+from signaling.history_cache import invalidate_history
 
 class UserManger(BaseUserManager):
     def create_user(self,email,password,**extra_fields):
@@ -37,6 +41,53 @@ class Room(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     owner = models.ForeignKey(User,on_delete=models.CASCADE, related_name="rooms" )
+    # Denormalized, maintained by User.signals so history frames never COUNT(*)
+    message_count = models.PositiveIntegerField(default=0)
+    # Last Message.seq handed out in this room
+    last_seq = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Room list cursor pages walk (created_at, id) backwards within is_active
+            models.Index(fields=['is_active', 'created_at', 'id'], name='room_active_created_id_idx'),
+            # Trigram indexes on UPPER(...) - the expression Django's icontains compares,
+            # so room search stops scanning the table (see User.search.search_rooms)
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='room_name_trgm'),
+            GinIndex(OpClass(Upper('description'), name='gin_trgm_ops'), name='room_description_trgm'),
+        ]
+
+    @classmethod
+    def allocate_seq(cls, room_id, count=1):
+        """Reserve `count` consecutive message sequence numbers; returns the first"""
+        # The UPDATE row-locks the room, so concurrent writers never share a number
+        with transaction.atomic():
+            cls.objects.filter(id=room_id).update(last_seq=models.F('last_seq') + count)
+            last_seq = cls.objects.filter(id=room_id).values_list('last_seq', flat=True).get()
+        return last_seq - count + 1
+
+    @classmethod
+    def decrement_message_counts(cls, counts):
+        """Take {room_id: deleted messages} off message_count, all rooms in one UPDATE"""
+        if not counts:
+            return
+        deleted = models.Case(
+            *[models.When(id=room_id, then=models.Value(count)) for room_id, count in counts.items()],
+            output_field=models.PositiveIntegerField(),
+        )
+        cls.objects.filter(id__in=counts).update(
+            message_count=Greatest(models.F('message_count') - deleted, models.Value(0))
+        )
+
+
+class MessageQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete, then update the rooms' message_count once rather than per message"""
+        with transaction.atomic(using=self.db):
+            counts = dict(self.order_by().values_list('room_id').annotate(models.Count('id')))
+            deleted = super().delete()
+            Room.decrement_message_counts(counts)
+            invalidate_history(counts)
+        return deleted
 
 
 class Message(models.Model):
@@ -44,26 +95,61 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     message = models.TextField(blank=True, null=True)
     sender_type = models.CharField(max_length=20, default='user')
+    # Per-room, gap-free under normal operation; assigned by User.signals on insert
+    seq = models.PositiveBigIntegerField(editable=False)
+    # Write-behind entry id, so a replayed journal entry is recognised as already stored
+    write_id = models.UUIDField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_read = models.BooleanField(default=False)
-    
+    # Maintained from `message` by the message_search_vector trigger, bulk inserts included
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # No post_delete receiver keeps message_count: any Message delete signal
+    # makes room and user cascades load and signal every message row
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Keyset pagination walks (room, created_at, id) backwards
+            models.Index(fields=['room', 'created_at', 'id'], name='message_room_created_id_idx'),
+            # Room-scoped full-text search (btree_gin lets room_id share the GIN index)
+            GinIndex(fields=['room', 'search_vector'], name='message_room_search_gin'),
+        ]
+        constraints = [
+            # Also the index behind "everything after seq N" range reads
+            models.UniqueConstraint(fields=['room', 'seq'], name='message_room_seq_uniq'),
+            models.UniqueConstraint(
+                fields=['write_id'], condition=models.Q(write_id__isnull=False), name='message_write_id_uniq'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.sender.name}: {self.message[:50]}"
 
+    def delete(self, using=None, keep_parents=False):
+        with transaction.atomic(using=using):
+            deleted = super().delete(using=using, keep_parents=keep_parents)
+            Room.decrement_message_counts({self.room_id: 1})
+            invalidate_history([self.room_id])
+        return deleted
+
 
 class Attachment(models.Model):
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='attachments')
+    # Null until an out-of-band upload is claimed by a chat message
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='attachments', blank=True, null=True)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='attachments', blank=True, null=True)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads', blank=True, null=True)
     file = models.FileField(upload_to='chat_attachments/%Y/%m/%d/', blank=True, null=True)
     file_url = models.URLField(blank=True, null=True)
     file_type = models.CharField(max_length=100)
     original_filename = models.CharField(max_length=255)
     file_size = models.IntegerField()
+    # Bytes of a resumable upload committed to its staging file so far
+    upload_offset = models.PositiveBigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"{self.original_filename} - {self.message.id}"
+        return f"{self.original_filename} - {self.message_id}"
 
@@ -0,0 +1,13 @@
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+from signaling.codecs import get_codec, DecodeError
+
+
+class CodecJSONParser(parsers.JSONParser):
+    """JSONParser that decodes through the codec selected by settings.JSON_CODEC"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return get_codec().loads(stream.read())
+        except DecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
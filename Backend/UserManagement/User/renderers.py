@@ -0,0 +1,20 @@
+from rest_framework import renderers
+from rest_framework.utils import encoders
+from signaling.codecs import get_codec
+
+# One hook for every render, so codecs can reuse the encoder they build around it
+encode_default = encoders.JSONEncoder().default
+
+
+class CodecJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer that encodes through the codec selected by settings.JSON_CODEC"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        # Indented output (e.g. ?indent=4 in the Accept header) stays on DRF's encoder
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return get_codec().dumpb(data, default=encode_default)
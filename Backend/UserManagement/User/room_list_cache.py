@@ -0,0 +1,162 @@
+# room_list_cache.py
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from django.conf import settings
+from signaling.codecs import get_codec
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_room_list_query(request):
+    """The parts of a room list request that decide its response, as a stable key"""
+    params = request.GET
+    cursor_mode = params.get("pagination") == "cursor" or "cursor" in params
+    query = {
+        # Paginated responses carry absolute next/previous links
+        "base": request.build_absolute_uri("/"),
+        "active": params.get("active", "true").lower() == "true",
+        # icontains and trigram similarity both ignore case
+        "search": params.get("search", "").strip().lower(),
+        "page_size": params.get("page_size", ""),
+        "cursor": params.get("cursor", "") if cursor_mode else None,
+        "page": None if cursor_mode else params.get("page", "1"),
+    }
+    return hashlib.sha1(json.dumps(query, sort_keys=True).encode()).hexdigest()
+
+
+def make_etag(data):
+    return '"%s"' % hashlib.sha1(get_codec().dumpb(data)).hexdigest()
+
+
+class LocalRoomListCache:
+    """In-process LRU of room list responses - single worker only"""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version = 0
+
+    def lookup(self, key):
+        """Return (entry or None, current version); entries are {'etag', 'data'}"""
+        item = self.entries.get(key)
+        if item is None:
+            return None, self.version
+        expires_at, version, entry = item
+        if version != self.version or expires_at < time.monotonic():
+            del self.entries[key]
+            return None, self.version
+        self.entries.move_to_end(key)
+        return entry, self.version
+
+    def store(self, key, version, data):
+        """Cache `data` as of `version` and return its entry"""
+        entry = {'etag': make_etag(data), 'data': data}
+        if version == self.version:
+            self.entries[key] = (time.monotonic() + self.ttl, version, entry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self):
+        self.version += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.version = 0
+
+
+class RedisRoomListCache:
+    """Room list responses in Redis, shared by all workers.
+
+    Each entry records the version it was built under; invalidate() bumps
+    the version with one INCR, after which older entries read as misses
+    and age out. A sorted set of keys by insertion time caps the number
+    of entries at `max_entries`, oldest evicted first.
+    """
+    prefix = 'rooms:list'
+
+    def __init__(self, url, ttl, max_entries):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @property
+    def version_key(self):
+        return f'{self.prefix}:version'
+
+    @property
+    def index_key(self):
+        return f'{self.prefix}:index'
+
+    def key(self, key):
+        return f'{self.prefix}:entry:{key}'
+
+    def lookup(self, key):
+        """Return (entry or None, current version) in one round trip"""
+        try:
+            version, raw = self.redis.mget(self.version_key, self.key(key))
+        except Exception as e:
+            logger.info(f"Room list cache read failed: {e}")
+            return None, None
+        version = int(version or 0)
+        if raw is None:
+            return None, version
+        cached = get_codec().loads(raw)
+        if cached['version'] != version:
+            return None, version
+        return cached['entry'], version
+
+    def store(self, key, version, data):
+        entry = {'etag': make_etag(data), 'data': data}
+        if version is None:
+            # Redis was unreachable on lookup; don't cache under a guessed version
+            return entry
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(self.key(key), get_codec().dumpb({'version': version, 'entry': entry}), ex=self.ttl)
+            pipe.zadd(self.index_key, {key: time.time()})
+            pipe.zcard(self.index_key)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = self.redis.zpopmin(self.index_key, size - self.max_entries)
+                if evicted:
+                    self.redis.delete(*[self.key(member.decode()) for member, _ in evicted])
+        except Exception as e:
+            logger.info(f"Room list cache write failed: {e}")
+        return entry
+
+    def invalidate(self):
+        try:
+            self.redis.incr(self.version_key)
+        except Exception as e:
+            logger.info(f"Room list cache invalidation failed: {e}")
+
+    def clear(self):
+        for key in self.redis.scan_iter(match=f'{self.prefix}:*'):
+            self.redis.delete(key)
+
+
+@lru_cache(maxsize=None)
+def load_room_list_cache(backend, url, ttl, max_entries):
+    if backend == 'redis':
+        return RedisRoomListCache(url, ttl, max_entries)
+    if backend == 'local':
+        return LocalRoomListCache(ttl, max_entries)
+    return None
+
+
+def get_room_list_cache():
+    """Room list response cache selected by settings.ROOM_LIST_CACHE_BACKEND, or None when disabled"""
+    return load_room_list_cache(
+        settings.ROOM_LIST_CACHE_BACKEND,
+        settings.ROOM_LIST_CACHE_URL,
+        settings.ROOM_LIST_CACHE_TTL,
+        settings.ROOM_LIST_CACHE_MAX_ENTRIES,
+    )
@@ -0,0 +1,108 @@
+# search.py
+import base64
+import binascii
+import json
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Coalesce, Greatest
+from .models import Message
+
+# Text search configuration - must match the one the message_search_vector trigger uses
+SEARCH_CONFIG = 'english'
+
+
+class SearchTimeout(Exception):
+    """Raised when a search runs past CHAT_SEARCH_TIMEOUT_MS"""
+
+
+class InvalidCursor(ValueError):
+    """Raised for a pagination cursor this module did not produce"""
+
+
+def encode_cursor(*values):
+    """Opaque cursor for the row after `values` in a keyset ordering"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, *types):
+    """Cursor values converted with `types`, one per value encode_cursor was given"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(types):
+            raise ValueError(f"Expected {len(types)} cursor values")
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (AttributeError, binascii.Error, TypeError, ValueError) as e:
+        raise InvalidCursor("Invalid pagination cursor") from e
+
+
+def is_query_canceled(error):
+    """True when a DB error is Postgres' query_canceled, as a statement_timeout raises"""
+    cause = error.__cause__
+    # psycopg 3 names the SQLSTATE `sqlstate`, psycopg2 `pgcode`
+    code = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    return code == '57014'
+
+
+def search_messages(room_id, query, limit, cursor=None):
+    """Rank a room's messages against a web-search style `query`.
+
+    Matches come from the (room, search_vector) GIN index and are ordered
+    by rank, then id, both descending; `cursor` resumes after the last
+    result of the previous page. The statement is cancelled once it runs
+    for CHAT_SEARCH_TIMEOUT_MS. Returns (messages, next_cursor) with
+    sender and attachments prefetched and `rank` set on every message.
+    """
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    messages = Message.objects.filter(
+        room_id=room_id, search_vector=search_query
+    ).annotate(
+        # ts_rank returns real; as double precision the value round-trips through
+        # the cursor exactly, so rows tied on rank compare equal on the next page
+        rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+    )
+
+    if cursor:
+        rank, message_id = decode_cursor(cursor, float, int)
+        messages = messages.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=message_id))
+
+    messages = messages.select_related('sender').prefetch_related('attachments').defer('search_vector').order_by('-rank', '-id')
+
+    try:
+        with transaction.atomic():
+            with connection.cursor() as c:
+                # SET LOCAL ends with the transaction, so pooled connections keep their default
+                c.execute(f"SET LOCAL statement_timeout = {int(settings.CHAT_SEARCH_TIMEOUT_MS)}")
+            # Fetch one extra row so the next cursor doesn't need a COUNT(*)
+            results = list(messages[:limit + 1])
+    except OperationalError as e:
+        if is_query_canceled(e):
+            raise SearchTimeout(f"Search took longer than {settings.CHAT_SEARCH_TIMEOUT_MS}ms") from e
+        raise
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_cursor(results[-1].rank, results[-1].id)
+    return results, next_cursor
+
+
+def search_rooms(rooms, search):
+    """Narrow a Room queryset to `search` matches in name or description.
+
+    Matching keeps the icontains semantics the dashboard always had and is
+    served by the room_*_trgm indexes. With the 'trigram' backend
+    (ROOM_SEARCH_BACKEND) results are ordered by trigram word similarity,
+    name matches weighted above description ones, newest first on ties;
+    'basic' only filters and keeps the caller's ordering.
+    """
+    rooms = rooms.filter(Q(name__icontains=search) | Q(description__icontains=search))
+    if settings.ROOM_SEARCH_BACKEND != 'trigram':
+        return rooms
+    return rooms.annotate(
+        relevance=Greatest(
+            TrigramWordSimilarity(search, 'name'),
+            Coalesce(TrigramWordSimilarity(search, 'description'), 0.0) * 0.5,
+        )
+    ).order_by('-relevance', '-created_at', '-id')
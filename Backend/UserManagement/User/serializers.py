@@ -103,7 +103,13 @@ class MessageSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Message
-        fields = ['id', 'message', 'sender', 'sender_type', 'created_at', 'attachments']
+        fields = ['id', 'seq', 'message', 'sender', 'sender_type', 'created_at', 'attachments']
+
+class MessageSearchResultSerializer(MessageSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['rank']
 
 class RoomSerializer(serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
@@ -111,3 +117,17 @@ class RoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = Room
         fields = ['id', 'name', 'description',  'is_active', 'owner', 'created_at']
+
+class AttachmentUploadSerializer(serializers.ModelSerializer):
+    """Same shape as the `media` items of chat_message frames"""
+    name = serializers.CharField(source='original_filename')
+    type = serializers.CharField(source='file_type')
+    size = serializers.IntegerField(source='file_size')
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Attachment
+        fields = ['id', 'name', 'type', 'size', 'url']
+
+    def get_url(self, obj):
+        return obj.file.url if obj.file else None
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Room, Message, User
+from .room_list_cache import get_room_list_cache
+from signaling.history_cache import invalidate_history
+
+
+@receiver(pre_save, sender=Message)
+def assign_message_seq(sender, instance, **kwargs):
+    """Give new messages the next sequence number of their room"""
+    if instance._state.adding and instance.seq is None:
+        instance.seq = Room.allocate_seq(instance.room_id)
+
+
+@receiver(post_save, sender=Message)
+def increment_room_message_count(sender, instance, created, **kwargs):
+    """Keep Room.message_count in step with inserted messages"""
+    if created:
+        Room.objects.filter(id=instance.room_id).update(message_count=F('message_count') + 1)
+
+
+@receiver(pre_delete, sender=User)
+def decrement_room_message_counts(sender, instance, **kwargs):
+    """Take a deleted user's messages off Room.message_count before they cascade.
+
+    Direct message deletes adjust the counts themselves (Message.delete and
+    MessageQuerySet.delete); a room's own cascade needs nothing, the room goes too.
+    """
+    counts = dict(Message.objects.filter(sender=instance).order_by().values_list('room_id').annotate(Count('id')))
+    Room.decrement_message_counts(counts)
+    invalidate_history(counts)
+
+
+@receiver(post_delete, sender=Room)
+def invalidate_room_history(sender, instance, **kwargs):
+    """Stop serving a deleted room's cached messages"""
+    invalidate_history([instance.id])
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_list_cache(sender, instance, **kwargs):
+    """Bump the room list cache version once a room change is committed"""
+    cache = get_room_list_cache()
+    if cache:
+        # After commit, so no reader can cache the old rows under the new version
+        transaction.on_commit(cache.invalidate)
@@ -1,6 +1,8 @@
 # chat/tests/test_models.py
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
 from User.models import User, Room, Message, Attachment
+from signaling.history_cache import get_history_cache
 
 
 class UserModelTest(TestCase):
@@ -36,6 +38,54 @@ class MessageModelTest(TestCase):
         self.assertEqual(message.sender, self.user)
         self.assertEqual(message.message, "Hello World")
         self.assertFalse(message.is_read)
+
+    def test_room_message_count_tracks_inserts_and_deletes(self):
+        first = Message.objects.create(room=self.room, sender=self.user, message="One")
+        Message.objects.create(room=self.room, sender=self.user, message="Two")
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.message_count, 2)
+
+        first.delete()
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.message_count, 1)
+
+    def test_room_message_count_tracks_bulk_and_cascade_deletes(self):
+        other_user = User.objects.create_user(email="other@example.com", password="pass", name="User2")
+        other_room = Room.objects.create(name="Room2", owner=self.user)
+        for room, sender in [(self.room, self.user), (self.room, other_user), (self.room, other_user), (other_room, other_user)]:
+            Message.objects.create(room=room, sender=sender, message="Hi")
+
+        Message.objects.filter(room=other_room).delete()
+        other_room.refresh_from_db()
+        self.assertEqual(other_room.message_count, 0)
+
+        # Deleting a sender cascades to their messages in rooms that stay
+        other_user.delete()
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.message_count, 1)
+
+    @override_settings(CHAT_HISTORY_CACHE_BACKEND='local')
+    def test_message_delete_evicts_room_history(self):
+        message = Message.objects.create(room=self.room, sender=self.user, message="Gone soon")
+        cache = get_history_cache()
+        generation = async_to_sync(cache.generation)(self.room.id)
+        async_to_sync(cache.fill)(self.room.id, [{'id': message.id, 'seq': message.seq}], generation)
+        self.assertIsNotNone(async_to_sync(cache.get_recent)(self.room.id, 10))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            message.delete()
+        self.assertIsNone(async_to_sync(cache.get_recent)(self.room.id, 10))
+
+    def test_messages_get_per_room_sequence_numbers(self):
+        other_room = Room.objects.create(name="Room2", owner=self.user)
+        first = Message.objects.create(room=self.room, sender=self.user, message="One")
+        other = Message.objects.create(room=other_room, sender=self.user, message="Elsewhere")
+        second = Message.objects.create(room=self.room, sender=self.user, message="Two")
+        self.assertEqual((first.seq, second.seq, other.seq), (1, 2, 1))
+
+        self.assertEqual(Room.allocate_seq(self.room.id, count=3), 3)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_seq, 5)
         
         
 class AttachmentModelTest(TestCase):
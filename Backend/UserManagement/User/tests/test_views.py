@@ -1,6 +1,20 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.db import OperationalError
 from rest_framework.test import APITestCase, APIClient
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.test import override_settings
 from django.urls import reverse
-from User.models import User, Room
+from django.utils import timezone
+from User.models import User, Room, Attachment, Message
+from User.room_list_cache import get_room_list_cache
+from User.search import search_messages
+from User.views import ResumableUploadChunkView
 
 
 class UserAuthViewsTest(APITestCase):
@@ -30,12 +44,14 @@ class UserAuthViewsTest(APITestCase):
         self.assertIn('access_token', response.data['user'])
         
         
+@override_settings(ROOM_LIST_CACHE_BACKEND='local')
 class RoomViewsTest(APITestCase):
     def setUp(self):
         self.client = APIClient()
         self.user = User.objects.create_user(email='user@example.com', password='Test@1234', name='User1')
         self.client.force_authenticate(user=self.user)
         self.room_list_url = reverse('roomcreation')  
+        get_room_list_cache().clear()
 
     def test_create_room_success(self):
         data = {'name': 'New Room','description':'test description for the room'}
@@ -55,8 +71,133 @@ class RoomViewsTest(APITestCase):
         Room.objects.create(name='Room2', owner=self.user)
         response = self.client.get(self.room_list_url)
         self.assertEqual(response.status_code, 200)
+
+    def test_search_rooms_orders_by_relevance(self):
+        Room.objects.create(name='Weekly sync', description='design review notes', owner=self.user)
+        Room.objects.create(name='Design', owner=self.user)
+        Room.objects.create(name='Random', owner=self.user)
+        response = self.client.get(self.room_list_url, {'search': 'design'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([room['name'] for room in response.data['results']], ['Design', 'Weekly sync'])
+
+    def test_get_rooms_loads_owners_with_rooms(self):
+        for i in range(5):
+            owner = User.objects.create_user(email=f'owner{i}@example.com', password='Test@1234', name=f'Owner{i}')
+            Room.objects.create(name=f'Room{i}', owner=owner)
+        # COUNT(*) and the page itself, however many owners are on it
+        with self.assertNumQueries(2):
+            response = self.client.get(self.room_list_url)
+        self.assertEqual(response.data['results'][0]['owner']['name'], 'Owner4')
+
+    def test_get_rooms_cursor_pagination(self):
+        for i in range(3):
+            Room.objects.create(name=f'Room{i}', owner=self.user)
+        response = self.client.get(self.room_list_url, {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        self.assertEqual([room['name'] for room in response.data['results']], ['Room2', 'Room1'])
+
+        response = self.client.get(self.room_list_url, {'cursor': response.data['next_cursor'], 'page_size': 2})
+        self.assertEqual([room['name'] for room in response.data['results']], ['Room0'])
+        self.assertIsNone(response.data['next'])
+
+    def test_get_rooms_served_from_cache_with_etag(self):
+        Room.objects.create(name='Room1', owner=self.user)
+        response = self.client.get(self.room_list_url, {'search': ' Room '})
+        etag = response['ETag']
+        self.assertEqual(response.data['count'], 1)
+
+        # Same normalized query: no database work, and 304 when the client has it
+        with self.assertNumQueries(0):
+            response = self.client.get(self.room_list_url, {'search': 'room'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.room_list_url, {'name': 'Room2'})
+        response = self.client.get(self.room_list_url, {'search': 'room'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_get_rooms_bad_cursor(self):
+        response = self.client.get(self.room_list_url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['field'], 'cursor')
+
+    @override_settings(ROOM_SEARCH_BACKEND='basic')
+    def test_search_rooms_basic_backend_keeps_newest_first(self):
+        Room.objects.create(name='Design', owner=self.user)
+        Room.objects.create(name='Weekly sync', description='design review notes', owner=self.user)
+        response = self.client.get(self.room_list_url, {'search': 'design'})
+        self.assertEqual([room['name'] for room in response.data['results']], ['Weekly sync', 'Design'])
         
 
+class MessageSearchViewTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='user@example.com', password='Test@1234', name='User1')
+        self.client.force_authenticate(user=self.user)
+        self.room = Room.objects.create(name='Room1', owner=self.user)
+        other = Room.objects.create(name='Room2', owner=self.user)
+        for text in ['release notes are out', 'coffee?', 'notes from the release meeting']:
+            Message.objects.create(room=self.room, sender=self.user, message=text)
+        Message.objects.create(room=other, sender=self.user, message='release elsewhere')
+        self.url = reverse('message_search', kwargs={'room_id': self.room.id})
+
+    def test_search_is_room_scoped_and_paginated(self):
+        response = self.client.get(self.url, {'q': 'releases', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIn('rank', response.data['results'][0])
+        first = response.data['results'][0]['id']
+
+        response = self.client.get(self.url, {'q': 'releases', 'limit': 1, 'cursor': response.data['next_cursor']})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertNotEqual(response.data['results'][0]['id'], first)
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_search_pages_through_tied_ranks(self):
+        for i in range(5):
+            Message.objects.create(room=self.room, sender=self.user, message=f'deploy number {i}')
+        seen, cursor = [], None
+        while True:
+            params = {'q': 'deploy', 'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(len({result['rank'] for result in response.data['results']}), 1)
+            seen.extend(result['id'] for result in response.data['results'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_search_timeout_on_either_psycopg(self):
+        for attribute in ('sqlstate', 'pgcode'):
+            cause = Exception('canceling statement due to statement timeout')
+            setattr(cause, attribute, '57014')
+            error = OperationalError(str(cause))
+            error.__cause__ = cause
+            with mock.patch('User.search.transaction.atomic', side_effect=error):
+                response = self.client.get(self.url, {'q': 'release'})
+            self.assertEqual(response.status_code, 503)
+
+    def test_search_does_not_load_search_vector(self):
+        messages, _ = search_messages(self.room.id, 'release', 10)
+        self.assertTrue(messages)
+        self.assertIn('search_vector', messages[0].get_deferred_fields())
+
+    def test_search_requires_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_rejects_bad_cursor(self):
+        response = self.client.get(self.url, {'q': 'release', 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['field'], 'cursor')
+
+
 class TokenRefreshTest(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(email='user@example.com', password='Test@1234', name='User1')
@@ -68,3 +209,87 @@ class TokenRefreshTest(APITestCase):
         self.assertEqual(response.status_code, 400)
 
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CHAT_UPLOAD_TEMP_DIR=tempfile.mkdtemp())
+class AttachmentUploadViewsTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='user@example.com', password='Test@1234', name='User1')
+        self.client.force_authenticate(user=self.user)
+        self.room = Room.objects.create(name='Room1', owner=self.user)
+
+    def test_multipart_upload(self):
+        upload = SimpleUploadedFile('notes.txt', b'hello world', content_type='text/plain')
+        response = self.client.post(reverse('attachment_upload'), {'room_id': self.room.id, 'file': upload})
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get(id=response.data['attachments'][0]['id'])
+        self.assertEqual(attachment.file_size, 11)
+        self.assertEqual(attachment.uploaded_by, self.user)
+        self.assertIsNone(attachment.message)
+
+    def test_upload_requires_room(self):
+        upload = SimpleUploadedFile('notes.txt', b'hello world', content_type='text/plain')
+        response = self.client.post(reverse('attachment_upload'), {'room_id': 999, 'file': upload})
+        self.assertEqual(response.status_code, 400)
+
+    def test_resumable_upload(self):
+        response = self.client.post(
+            reverse('attachment_resumable_upload'),
+            {'room_id': self.room.id, 'name': 'big.bin', 'type': 'application/octet-stream', 'size': 10},
+        )
+        self.assertEqual(response.status_code, 201)
+        chunk_url = reverse('attachment_upload_chunk', args=[response.data['id']])
+
+        response = self.client.put(chunk_url, b'01234', content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.data['offset'], 5)
+        self.assertFalse(response.data['complete'])
+
+        response = self.client.put(chunk_url, b'56789', content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.status_code, 409)
+
+        response = self.client.put(chunk_url, b'56789', content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='5')
+        self.assertTrue(response.data['complete'])
+        attachment = Attachment.objects.get(id=response.data['id'])
+        self.assertEqual(attachment.file.read(), b'0123456789')
+
+    def test_concurrent_chunk_at_same_offset_loses(self):
+        response = self.client.post(
+            reverse('attachment_resumable_upload'),
+            {'room_id': self.room.id, 'name': 'big.bin', 'type': 'application/octet-stream', 'size': 10},
+        )
+        chunk_url = reverse('attachment_upload_chunk', args=[response.data['id']])
+        get_pending = ResumableUploadChunkView.get_pending_attachment
+
+        def read_then_race(view, request, attachment_id):
+            attachment = get_pending(view, request, attachment_id)
+            # Another PUT at offset 0 commits while this one streams its body
+            Attachment.objects.filter(id=attachment_id).update(upload_offset=5)
+            return attachment
+
+        with mock.patch.object(ResumableUploadChunkView, 'get_pending_attachment', read_then_race):
+            response = self.client.put(chunk_url, b'01234', content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 5)
+
+    def test_expired_upload_is_rejected_and_cleaned_up(self):
+        response = self.client.post(
+            reverse('attachment_resumable_upload'),
+            {'room_id': self.room.id, 'name': 'big.bin', 'type': 'application/octet-stream', 'size': 10},
+        )
+        attachment = Attachment.objects.get(id=response.data['id'])
+        claimed = Attachment.objects.create(
+            room=self.room, uploaded_by=self.user, file_type='text/plain', original_filename='kept.txt', file_size=1,
+            message=Message.objects.create(room=self.room, sender=self.user, message='hi'),
+        )
+        Attachment.objects.update(created_at=timezone.now() - timedelta(days=2))
+        partial = os.path.join(settings.CHAT_UPLOAD_TEMP_DIR, f'{attachment.id}.part')
+        self.assertTrue(os.path.exists(partial))
+
+        chunk_url = reverse('attachment_upload_chunk', args=[attachment.id])
+        response = self.client.put(chunk_url, b'01234', content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('expire_chat_uploads', stdout=StringIO())
+        self.assertFalse(Attachment.objects.filter(id=attachment.id).exists())
+        self.assertTrue(Attachment.objects.filter(id=claimed.id).exists())
+        self.assertFalse(os.path.exists(partial))
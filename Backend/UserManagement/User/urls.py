@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import UserSignupView,Login,RoomListCreateView,TokenRefreshFromCookieView
+from .views import UserSignupView,Login,RoomListCreateView,MessageSearchView,TokenRefreshFromCookieView,AttachmentUploadView,ResumableUploadCreateView,ResumableUploadChunkView
 
 
 
@@ -7,6 +7,10 @@ urlpatterns = [
     path('v1/auth/signup',UserSignupView.as_view() , name= 'signup'),
     path('v1/auth/login',Login.as_view() , name= 'login'),
     path('v1/rooms',RoomListCreateView.as_view() , name= 'roomcreation'),
+    path('v1/rooms/<int:room_id>/messages/search', MessageSearchView.as_view(), name='message_search'),
     path('v1/auth/refresh', TokenRefreshFromCookieView.as_view(), name='token_refresh'),  
+    path('v1/attachments', AttachmentUploadView.as_view(), name='attachment_upload'),
+    path('v1/attachments/uploads', ResumableUploadCreateView.as_view(), name='attachment_resumable_upload'),
+    path('v1/attachments/uploads/<int:attachment_id>', ResumableUploadChunkView.as_view(), name='attachment_upload_chunk'),
 ]
 
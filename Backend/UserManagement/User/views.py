@@ -7,13 +7,27 @@ from django.core.exceptions import ValidationError
 from .serializers import UserSignupSerializer,LoginSerializer
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import RoomSerializer
-from .models import Room, User
+from .serializers import RoomSerializer, AttachmentUploadSerializer, MessageSearchResultSerializer
+from .room_list_cache import get_room_list_cache, normalize_room_list_query
+from .search import InvalidCursor, SearchTimeout, decode_cursor, encode_cursor, search_messages, search_rooms
+from .models import Room, User, Attachment
+from django.db import transaction
 from django.db.models import Q
 from jwt import decode
+from signaling.query_budget import query_budget
 from rest_framework_simplejwt.exceptions import TokenError
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+from rest_framework.parsers import MultiPartParser
+from django.core.files import File
+import os
+import shutil
+import tempfile
+from datetime import timedelta
 
 
 logger = logging.getLogger(__name__)
@@ -24,6 +38,54 @@ class PaginationClass(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+
+class RoomCursorPagination(BasePagination):
+    """
+    Keyset pagination over rooms, newest first on (created_at, id).
+    Each page is one index range read: no COUNT(*) and no OFFSET, so
+    page 10,000 costs the same as page 1.
+    """
+    page_size = PaginationClass.page_size
+    page_size_query_param = PaginationClass.page_size_query_param
+    max_page_size = PaginationClass.max_page_size
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            page_size = min(int(request.query_params[self.page_size_query_param]), self.max_page_size)
+        except (KeyError, ValueError):
+            page_size = self.page_size
+        page_size = max(1, page_size)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, room_id = decode_cursor(cursor, parse_datetime, int)
+            if created_at is None:
+                raise InvalidCursor("Invalid pagination cursor")
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=room_id))
+
+        # Fetch one extra row to know whether there is a next page
+        rooms = list(queryset.order_by("-created_at", "-id")[:page_size + 1])
+        self.next_cursor = None
+        if len(rooms) > page_size:
+            rooms = rooms[:page_size]
+            self.next_cursor = encode_cursor(rooms[-1].created_at.isoformat(), rooms[-1].id)
+        return rooms
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), "page")
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "next_cursor": self.next_cursor,
+            "results": data,
+        })
+
 class UserSignupView(APIView):
     permission_classes = [AllowAny] 
      
@@ -137,32 +199,62 @@ class Login(APIView):
 class RoomListCreateView(APIView):
     permission_classes = [IsAuthenticated]
     pagination_class = PaginationClass
+    cursor_pagination_class = RoomCursorPagination
 
+    @query_budget(2)
     def get(self, request):
         """
         List all active rooms of the authenticated user with optional search and pagination.
+        Cursor pages are always newest first, so search results lose their relevance order there.
+        Pages are served from the room list cache when warm, with an ETag; a matching
+        If-None-Match gets 304 Not Modified.
         """
+        cache = get_room_list_cache()
+        if cache is None:
+            return self.list_rooms(request)
+
+        key = normalize_room_list_query(request)
+        entry, version = cache.lookup(key)
+        if entry is None:
+            response = self.list_rooms(request)
+            if response.status_code != 200:
+                return response
+            entry = cache.store(key, version, response.data)
+
+        if entry["etag"] in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(entry["data"])
+        response["ETag"] = entry["etag"]
+        # Authenticated data: browsers may keep it but must revalidate each time
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def list_rooms(self, request):
+        """Build the room list response from the database"""
         try:
             search = request.GET.get("search", "").strip()
             is_active = request.GET.get("active", "true").lower() == "true"
 
             # Filter rooms owned by current user and active status
-            rooms = Room.objects.filter(is_active=is_active)
-
-            # Search by name or description
-            if search:
-                rooms = rooms.filter(Q(name__icontains=search) | Q(description__icontains=search))
+            rooms = Room.objects.select_related("owner").filter(is_active=is_active)
 
             # Order by creation date descending
-            rooms = rooms.order_by("-created_at")
+            rooms = rooms.order_by("-created_at", "-id")
+
+            # Search by name or description, best match first
+            if search:
+                rooms = search_rooms(rooms, search)
 
-            # Pagination
-            paginator = self.pagination_class()
+            # Pagination: ?pagination=cursor (or a cursor) opts into keyset pages
+            paginator = self.get_paginator(request)
             paginated_rooms = paginator.paginate_queryset(rooms, request)
             serializer = RoomSerializer(paginated_rooms, many=True)
 
             return paginator.get_paginated_response(serializer.data)
 
+        except InvalidCursor as e:
+            return Response({"error": str(e), "field": "cursor"}, status=400)
         except Exception as e:
             logger.exception(f"{e} - Error fetching rooms")
             return Response(
@@ -170,6 +262,12 @@ class RoomListCreateView(APIView):
                 status=500,
             )
 
+    def get_paginator(self, request):
+        if request.GET.get("pagination") == "cursor" or "cursor" in request.GET:
+            return self.cursor_pagination_class()
+        return self.pagination_class()
+
+    @query_budget(2)
     def post(self, request):
         """
         Create a new room with the authenticated user as owner.
@@ -204,6 +302,45 @@ class RoomListCreateView(APIView):
                 status=500,
             )
     
+class MessageSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    # Room check, SET LOCAL, matches, prefetched attachments, inside a savepoint when nested
+    @query_budget(6)
+    def get(self, request, room_id):
+        """
+        Full-text search over a room's messages, best match first.
+        Pass the returned `next_cursor` back as `cursor` for the next page.
+        """
+        try:
+            query = request.GET.get("q", "").strip()
+            if not query:
+                return Response({"error": "Search query is required", "field": "q"}, status=400)
+
+            if not Room.objects.filter(id=room_id, is_active=True).exists():
+                return Response({"error": "Room not found"}, status=404)
+
+            try:
+                limit = max(1, min(int(request.GET.get("limit", 20)), settings.CHAT_SEARCH_MAX_RESULTS))
+            except ValueError:
+                return Response({"error": "limit must be a number", "field": "limit"}, status=400)
+
+            messages, next_cursor = search_messages(room_id, query, limit, request.GET.get("cursor"))
+            serializer = MessageSearchResultSerializer(messages, many=True)
+            return Response({"results": serializer.data, "next_cursor": next_cursor})
+
+        except InvalidCursor as e:
+            return Response({"error": str(e), "field": "cursor"}, status=400)
+        except SearchTimeout as e:
+            return Response({"error": str(e)}, status=503)
+        except Exception as e:
+            logger.exception(f"{e} - Error searching messages")
+            return Response(
+                {"error": "An error occurred while searching messages", "details": str(e)},
+                status=500,
+            )
+
+
 class TokenRefreshFromCookieView(APIView):
     permission_classes = [AllowAny]
     def post(self, request):
@@ -238,4 +375,209 @@ class TokenRefreshFromCookieView(APIView):
             return Response(
                 {"detail": f"Invalid or expired refresh token.{e}"},
                 status=status.HTTP_401_UNAUTHORIZED,
-            )
\ No newline at end of file
+            )
+
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def get_upload_room(room_id):
+    """Return the active Room an attachment is uploaded to, or None"""
+    if not str(room_id or "").isdigit():
+        return None
+    return Room.objects.filter(id=room_id, is_active=True).first()
+
+
+def get_upload_expiry_cutoff():
+    """Unclaimed uploads created before this are expired"""
+    return timezone.now() - timedelta(seconds=settings.CHAT_UPLOAD_EXPIRY)
+
+
+def get_partial_upload_path(attachment):
+    """Staging file for a resumable upload that has not completed yet"""
+    return os.path.join(settings.CHAT_UPLOAD_TEMP_DIR, f"{attachment.id}.part")
+
+
+class AttachmentUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        """
+        Upload chat attachments out-of-band as multipart `file` fields.
+        Django's upload handlers stream each file to disk/storage, and the
+        returned ids are then referenced from the WebSocket `message` event.
+        """
+        try:
+            room = get_upload_room(request.data.get("room_id"))
+            if not room:
+                return Response({"error": "A valid room is required", "field": "room_id"}, status=400)
+
+            files = request.FILES.getlist("file")
+            if not files:
+                return Response({"error": "No file provided", "field": "file"}, status=400)
+
+            for upload in files:
+                if upload.size > settings.CHAT_ATTACHMENT_MAX_SIZE:
+                    return Response(
+                        {"error": f"{upload.name} exceeds the maximum attachment size", "field": "file"},
+                        status=413,
+                    )
+
+            attachments = [
+                Attachment.objects.create(
+                    room=room,
+                    uploaded_by=request.user,
+                    file=upload,
+                    file_type=upload.content_type or "application/octet-stream",
+                    original_filename=upload.name,
+                    file_size=upload.size,
+                )
+                for upload in files
+            ]
+            serializer = AttachmentUploadSerializer(attachments, many=True)
+            return Response({"attachments": serializer.data}, status=201)
+
+        except Exception as e:
+            logger.exception(f"{e} - Error uploading attachment")
+            return Response(
+                {"error": "An error occurred while uploading the attachment", "details": str(e)},
+                status=500,
+            )
+
+
+class ResumableUploadCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Start a resumable upload. The client then PUTs raw chunks to
+        `v1/attachments/uploads/<id>` with an `Upload-Offset` header.
+        """
+        try:
+            room = get_upload_room(request.data.get("room_id"))
+            if not room:
+                return Response({"error": "A valid room is required", "field": "room_id"}, status=400)
+
+            name = str(request.data.get("name", "")).strip()
+            if not name:
+                return Response({"error": "File name is required", "field": "name"}, status=400)
+
+            size = request.data.get("size")
+            if not str(size or "").isdigit() or int(size) <= 0:
+                return Response({"error": "File size is required", "field": "size"}, status=400)
+            if int(size) > settings.CHAT_ATTACHMENT_MAX_SIZE:
+                return Response({"error": f"{name} exceeds the maximum attachment size", "field": "size"}, status=413)
+
+            attachment = Attachment.objects.create(
+                room=room,
+                uploaded_by=request.user,
+                file_type=request.data.get("type") or "application/octet-stream",
+                original_filename=name[:255],
+                file_size=int(size),
+            )
+            os.makedirs(settings.CHAT_UPLOAD_TEMP_DIR, exist_ok=True)
+            open(get_partial_upload_path(attachment), "wb").close()
+
+            return Response({"id": attachment.id, "offset": 0, "size": attachment.file_size}, status=201)
+
+        except Exception as e:
+            logger.exception(f"{e} - Error starting resumable upload")
+            return Response(
+                {"error": "An error occurred while starting the upload", "details": str(e)},
+                status=500,
+            )
+
+
+class ResumableUploadChunkView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_pending_attachment(self, request, attachment_id):
+        return Attachment.objects.filter(
+            id=attachment_id, uploaded_by=request.user, message__isnull=True,
+            # Past the expiry, expire_chat_uploads may be removing it
+            created_at__gte=get_upload_expiry_cutoff(),
+        ).first()
+
+    def upload_status(self, attachment):
+        return {
+            "id": attachment.id,
+            "offset": attachment.file_size if attachment.file else attachment.upload_offset,
+            "size": attachment.file_size,
+            "complete": bool(attachment.file),
+        }
+
+    def get(self, request, attachment_id):
+        """
+        Report how many bytes of a resumable upload have been received.
+        """
+        attachment = self.get_pending_attachment(request, attachment_id)
+        if not attachment:
+            return Response({"error": "Upload not found"}, status=404)
+        return Response(self.upload_status(attachment), status=200)
+
+    def put(self, request, attachment_id):
+        """
+        Append a raw chunk at `Upload-Offset`. The chunk is streamed to a
+        temporary file with no transaction open, then appended to the staging
+        file only if the upload is still at that offset. The completed file
+        is moved into Attachment.file.
+        """
+        try:
+            attachment = self.get_pending_attachment(request, attachment_id)
+            if not attachment:
+                return Response({"error": "Upload not found"}, status=404)
+
+            upload_status = self.upload_status(attachment)
+            if upload_status["complete"]:
+                return Response(upload_status, status=200)
+
+            offset = request.headers.get("Upload-Offset", "")
+            if not offset.isdigit() or int(offset) != upload_status["offset"]:
+                return Response({"error": "Upload offset mismatch", **upload_status}, status=409)
+
+            expected = attachment.upload_offset
+            remaining = attachment.file_size - expected
+            path = get_partial_upload_path(attachment)
+            with tempfile.TemporaryFile(dir=settings.CHAT_UPLOAD_TEMP_DIR) as received:
+                size = 0
+                while request.stream is not None:
+                    chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > remaining:
+                        return Response({"error": "Chunk exceeds declared file size", **upload_status}, status=413)
+                    received.write(chunk)
+                received.seek(0)
+
+                with transaction.atomic():
+                    # Only moves the offset if no concurrent PUT got there first; the
+                    # row lock this UPDATE takes serializes the appends below
+                    claimed = Attachment.objects.filter(id=attachment.id, upload_offset=expected).update(
+                        upload_offset=expected + size
+                    )
+                    if not claimed:
+                        attachment.refresh_from_db()
+                        return Response({"error": "Upload offset mismatch", **self.upload_status(attachment)}, status=409)
+                    with open(path, "r+b") as partial:
+                        # Drop bytes a rolled-back append may have left behind
+                        partial.truncate(expected)
+                        partial.seek(expected)
+                        shutil.copyfileobj(received, partial)
+            attachment.upload_offset = expected + size
+
+            # Only the PUT that moved the offset to the end gets here with size > 0
+            if size and attachment.upload_offset == attachment.file_size:
+                with open(path, "rb") as partial:
+                    attachment.file.save(attachment.original_filename, File(partial), save=True)
+                os.remove(path)
+
+            return Response(self.upload_status(attachment), status=200)
+
+        except Exception as e:
+            logger.exception(f"{e} - Error uploading attachment chunk")
+            return Response(
+                {"error": "An error occurred while uploading the chunk", "details": str(e)},
+                status=500,
+            )
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 from decouple import config
 
@@ -34,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "channels",
     'rest_framework',
     'User',
@@ -73,6 +75,14 @@ TEMPLATES = [
 WSGI_APPLICATION = 'UserManagement.wsgi.application'
 
 
+# Connection reuse: with DATABASES_POOL each process keeps a psycopg (3) pool, the
+# way to reuse connections under Daphne. DATABASES_CONN_MAX_AGE stays 0 by default:
+# ASGI runs each sync view in its own thread-sensitive context, so persistent
+# connections aren't reused there and pile up until they age out (Django #33497).
+# Only raise it for WSGI/management processes. `manage.py benchmark_db_connections`
+# compares the modes, single-threaded, so it can't show the ASGI pile-up.
+DATABASES_POOL = config('DATABASES_POOL', default=False, cast=bool)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -81,11 +91,29 @@ DATABASES = {
         'PORT': config('DATABASES_PORT'),
         'USER': config('DATABASES_USER'),
         'PASSWORD': config('DATABASES_PASSWORD'),
-        
+        # Django rejects persistent connections on top of a pool
+        'CONN_MAX_AGE': 0 if DATABASES_POOL else config('DATABASES_CONN_MAX_AGE', default=0, cast=int),
+        'CONN_HEALTH_CHECKS': config('DATABASES_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        'OPTIONS': {
+            'pool': {
+                'min_size': config('DATABASES_POOL_MIN_SIZE', default=2, cast=int),
+                'max_size': config('DATABASES_POOL_MAX_SIZE', default=20, cast=int),
+                'timeout': config('DATABASES_POOL_TIMEOUT', default=10, cast=int),
+            },
+        } if DATABASES_POOL else {},
     }
 }
 AUTH_USER_MODEL ='User.User'
 
+# Views and consumer handlers decorated with signaling.query_budget declare how many
+# queries they may run; going over is logged and counted, and raises when strict
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default='test' in sys.argv[1:2], cast=bool)
+
+# /metrics serves the serving worker's signaling.metrics registry in the Prometheus
+# text format; off by default, and bearer-token protected when METRICS_TOKEN is set
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -122,7 +150,90 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'User.renderers.CodecJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'User.parsers.CodecJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+# JSON codec for WebSocket frames and DRF: auto | orjson | msgspec | stdlib
+JSON_CODEC = config('JSON_CODEC', default='auto')
+# Allow ChatConsumer clients to negotiate the chat.msgpack.v1 binary subprotocol
+CHAT_MSGPACK_ENABLED = config('CHAT_MSGPACK_ENABLED', default=True, cast=bool)
+
+# WebSocket auth: per-process cache of user principals resolved from JWTs
+CHAT_USER_CACHE_TTL = config('CHAT_USER_CACHE_TTL', default=60, cast=int)
+CHAT_USER_CACHE_SIZE = config('CHAT_USER_CACHE_SIZE', default=10000, cast=int)
+
+# Recent-message ring buffer per room served on connect: redis | local | none
+CHAT_HISTORY_CACHE_BACKEND = config('CHAT_HISTORY_CACHE_BACKEND', default='redis')
+CHAT_HISTORY_CACHE_URL = config('CHAT_HISTORY_CACHE_URL', default='redis://127.0.0.1:6379/1')
+CHAT_HISTORY_CACHE_SIZE = config('CHAT_HISTORY_CACHE_SIZE', default=50, cast=int)
+CHAT_HISTORY_CACHE_ROOMS = config('CHAT_HISTORY_CACHE_ROOMS', default=1000, cast=int)
+CHAT_HISTORY_CACHE_TTL = config('CHAT_HISTORY_CACHE_TTL', default=60 * 60, cast=int)
+# Clients reconnecting with ?since_id= get at most this many missed messages,
+# beyond that they get resync_required and the newest page
+CHAT_RESUME_MAX_GAP = config('CHAT_RESUME_MAX_GAP', default=100, cast=int)
+# Room list search: trigram (index-backed, relevance ordered) | basic (plain icontains, newest first)
+ROOM_SEARCH_BACKEND = config('ROOM_SEARCH_BACKEND', default='trigram')
+# Room list response cache: redis | local | none. Entries are keyed on the normalized
+# query, live ROOM_LIST_CACHE_TTL seconds, at most ROOM_LIST_CACHE_MAX_ENTRIES of them;
+# saving or deleting a Room bumps the cache version, which drops them all
+ROOM_LIST_CACHE_BACKEND = config('ROOM_LIST_CACHE_BACKEND', default='redis')
+ROOM_LIST_CACHE_URL = config('ROOM_LIST_CACHE_URL', default=CHAT_HISTORY_CACHE_URL)
+ROOM_LIST_CACHE_TTL = config('ROOM_LIST_CACHE_TTL', default=60, cast=int)
+ROOM_LIST_CACHE_MAX_ENTRIES = config('ROOM_LIST_CACHE_MAX_ENTRIES', default=10000, cast=int)
+# Room message search (REST and the `search` event): page size cap, and the
+# statement_timeout after which a search is cancelled instead of scanning on
+CHAT_SEARCH_MAX_RESULTS = config('CHAT_SEARCH_MAX_RESULTS', default=50, cast=int)
+CHAT_SEARCH_TIMEOUT_MS = config('CHAT_SEARCH_TIMEOUT_MS', default=2000, cast=int)
+
+# Write-behind chat persistence: messages get their seq up front, are broadcast at
+# once and written with bulk_create every CHAT_WRITE_BEHIND_INTERVAL_MS.
+# Backend redis | local (single worker); durability journal (Redis stream before
+# broadcast, replayed after CHAT_WRITE_BEHIND_RECLAIM_MS) | memory (lost on crash)
+CHAT_WRITE_BEHIND_ENABLED = config('CHAT_WRITE_BEHIND_ENABLED', default=False, cast=bool)
+CHAT_WRITE_BEHIND_BACKEND = config('CHAT_WRITE_BEHIND_BACKEND', default='redis')
+CHAT_WRITE_BEHIND_URL = config('CHAT_WRITE_BEHIND_URL', default=CHAT_HISTORY_CACHE_URL)
+CHAT_WRITE_BEHIND_DURABILITY = config('CHAT_WRITE_BEHIND_DURABILITY', default='journal')
+CHAT_WRITE_BEHIND_INTERVAL_MS = config('CHAT_WRITE_BEHIND_INTERVAL_MS', default=20, cast=int)
+CHAT_WRITE_BEHIND_BATCH_SIZE = config('CHAT_WRITE_BEHIND_BATCH_SIZE', default=200, cast=int)
+CHAT_WRITE_BEHIND_RECLAIM_MS = config('CHAT_WRITE_BEHIND_RECLAIM_MS', default=30000, cast=int)
+
+# Room presence: join/leave changes are coalesced into presence_delta events
+# every CHAT_PRESENCE_WINDOW_MS (0 = legacy per-connection user_join/user_leave)
+CHAT_PRESENCE_WINDOW_MS = config('CHAT_PRESENCE_WINDOW_MS', default=250, cast=int)
+CHAT_PRESENCE_BACKEND = config('CHAT_PRESENCE_BACKEND', default='redis')
+CHAT_PRESENCE_URL = config('CHAT_PRESENCE_URL', default=CHAT_HISTORY_CACHE_URL)
+CHAT_PRESENCE_TTL = config('CHAT_PRESENCE_TTL', default=24 * 60 * 60, cast=int)
+
+# Inbound WebSocket rate limits: event type -> scope -> (tokens per second, burst)
+CHAT_RATE_LIMIT_ENABLED = config('CHAT_RATE_LIMIT_ENABLED', default=True, cast=bool)
+CHAT_RATE_LIMITS = {
+    'message': {'user': (5, 10), 'room': (50, 100)},
+    'fetch_messages': {'user': (2, 5), 'room': (20, 40)},
+    'resume': {'user': (1, 3)},
+    'search': {'user': (1, 5), 'room': (10, 20)},
+    'refresh_token': {'user': (0.1, 3)},
 }
+CHAT_RATE_LIMIT_MAX_BUCKETS = config('CHAT_RATE_LIMIT_MAX_BUCKETS', default=100000, cast=int)
+
+# Per-connection outbound queue: frames buffered before the overflow policy kicks in
+# (0 = send inline). drop_ephemeral sheds presence frames first, close evicts at once;
+# either way the connection is finally closed with code 4009 so the client resyncs
+# The queue only fills when send() blocks. Under Daphne, send() never waits for the
+# socket, so a slow client is not caught (see signaling.outbound.OutboundBuffer)
+CHAT_OUTBOUND_HIGH_WATER = config('CHAT_OUTBOUND_HIGH_WATER', default=256, cast=int)
+CHAT_OUTBOUND_OVERFLOW_POLICY = config('CHAT_OUTBOUND_OVERFLOW_POLICY', default='drop_ephemeral')
+# Clients connecting with ?batch=1 get outbound frames coalesced into `batch` frames
+# every CHAT_BATCH_WINDOW_MS, at most CHAT_BATCH_MAX_FRAMES each (0 = never batch)
+CHAT_BATCH_WINDOW_MS = config('CHAT_BATCH_WINDOW_MS', default=5, cast=int)
+CHAT_BATCH_MAX_FRAMES = config('CHAT_BATCH_MAX_FRAMES', default=50, cast=int)
 
 ASGI_APPLICATION = "UserManagement.asgi.application"
 
@@ -139,6 +250,21 @@ CHANNELS_WS_PROTOCOLS = ["session"]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Thread pools for ChatConsumer's synchronous DB calls (0 = channels' shared default executor)
+CHAT_DB_READ_WORKERS = config('CHAT_DB_READ_WORKERS', default=8, cast=int)
+CHAT_DB_WRITE_WORKERS = config('CHAT_DB_WRITE_WORKERS', default=4, cast=int)
+
+# Out-of-band chat attachment uploads (User.views.AttachmentUploadView)
+CHAT_ATTACHMENT_MAX_SIZE = config('CHAT_ATTACHMENT_MAX_SIZE', default=25 * 1024 * 1024, cast=int)
+# Inline WebSocket media: CHAT_ATTACHMENT_MAX_SIZE per file, this for all files of one message
+CHAT_MESSAGE_ATTACHMENTS_MAX_SIZE = config('CHAT_MESSAGE_ATTACHMENTS_MAX_SIZE', default=50 * 1024 * 1024, cast=int)
+# Resumable uploads are staged here, outside the storage backend: with several
+# hosts behind a load balancer it must be a shared mount (or uploads pinned to one host)
+CHAT_UPLOAD_TEMP_DIR = config('CHAT_UPLOAD_TEMP_DIR', default=os.path.join(MEDIA_ROOT, 'chat_uploads_partial'))
+# Uploads no message has claimed after this many seconds stop accepting chunks;
+# `manage.py expire_chat_uploads` (run it from cron) deletes them and their files
+CHAT_UPLOAD_EXPIRY = config('CHAT_UPLOAD_EXPIRY', default=24 * 60 * 60, cast=int)
+
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
@@ -18,10 +18,12 @@ from django.conf import settings
 from django.contrib import admin
 from django.urls import path,include
 from django.conf.urls.static import static
+from signaling.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/',include('User.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SignalingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'signaling'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .query_budget import install_query_counter
+        connection_created.connect(install_query_counter, dispatch_uid='signaling.query_budget')
@@ -0,0 +1,85 @@
+# attachments.py
+import binascii
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+
+# Base64 characters decoded per step - a multiple of 4, so chunks never split a quantum
+CHUNK_CHARS = 64 * 1024
+
+
+class AttachmentTooLarge(ValueError):
+    """Raised when inline media exceeds the per-file or per-message byte limit"""
+
+    def __init__(self, name, limit):
+        super().__init__(f"{name} exceeds the maximum attachment size of {limit} bytes")
+        self.name = name
+        self.limit = limit
+
+
+# Separates a data URL's header from its base64 payload
+BASE64_MARKER = ';base64,'
+
+
+def decoded_length(encoded, start=0):
+    """Decoded size of the base64 in encoded[start:], worked out without decoding or copying it"""
+    padding = 2 if encoded.endswith('==') else 1 if encoded.endswith('=') else 0
+    return (len(encoded) - start) * 3 // 4 - padding
+
+
+class AttachmentBudget:
+    """Byte limits for the inline media of one chat message"""
+
+    def __init__(self, per_file=None, per_message=None):
+        self.per_file = settings.CHAT_ATTACHMENT_MAX_SIZE if per_file is None else per_file
+        self.per_message = settings.CHAT_MESSAGE_ATTACHMENTS_MAX_SIZE if per_message is None else per_message
+        self.used = 0
+
+    def limit(self):
+        """Bytes the next file may use"""
+        return max(0, min(self.per_file, self.per_message - self.used))
+
+    def check(self, name, size):
+        if size > self.limit():
+            raise AttachmentTooLarge(name, self.limit())
+
+    def spend(self, size):
+        self.used += size
+
+
+def open_inline_file(name, data, budget):
+    """Turn an inline media payload into a File, decoding base64 data URLs in chunks.
+
+    Decoded bytes are written to a spooled temporary file as they are
+    produced, so a large upload never exists as one decoded `bytes`
+    object. Sizes are checked against `budget` before decoding starts
+    and after every chunk. Returns (file, size); the caller closes the file.
+    """
+    if not isinstance(data, str) or not data.startswith('data:'):
+        # Raw MessagePack bytes (or plain text) are already in memory as-is
+        content = ContentFile(data, name=name)
+        budget.check(name, content.size)
+        budget.spend(content.size)
+        return content, content.size
+
+    # An offset rather than split(), which would copy the whole multi-MB payload
+    start = data.index(BASE64_MARKER) + len(BASE64_MARKER)
+    # Reject oversized payloads before decoding a single byte
+    budget.check(name, decoded_length(data, start))
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    size = 0
+    try:
+        for offset in range(start, len(data), CHUNK_CHARS):
+            chunk = binascii.a2b_base64(data[offset:offset + CHUNK_CHARS])
+            size += len(chunk)
+            budget.check(name, size)
+            spooled.write(chunk)
+    except Exception:
+        spooled.close()
+        raise
+
+    budget.spend(size)
+    spooled.seek(0)
+    return File(spooled, name=name), size
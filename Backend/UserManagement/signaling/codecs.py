@@ -0,0 +1,151 @@
+# codecs.py
+import json
+import logging
+from functools import lru_cache
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DecodeError(ValueError):
+    """Raised by every codec when a payload is not valid JSON"""
+
+
+class StdlibJSONCodec:
+    """Fallback codec built on the standard library json module"""
+    name = 'stdlib'
+
+    def dumps(self, obj, default=None):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=default)
+
+    def dumpb(self, obj, default=None):
+        return self.dumps(obj, default=default).encode('utf-8')
+
+    def loads(self, data):
+        try:
+            return json.loads(data)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise DecodeError(str(e)) from e
+
+
+class OrjsonCodec:
+    """orjson-backed codec - encodes straight to bytes in C"""
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def dumps(self, obj, default=None):
+        return self.dumpb(obj, default=default).decode('utf-8')
+
+    def dumpb(self, obj, default=None):
+        return self.orjson.dumps(obj, default=default, option=self.orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        try:
+            return self.orjson.loads(data)
+        except self.orjson.JSONDecodeError as e:
+            raise DecodeError(str(e)) from e
+
+
+class MsgspecCodec:
+    """msgspec-backed codec"""
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+        self.msgspec = msgspec
+        self.decoder = msgspec.json.Decoder()
+        self.encoders = {}
+
+    def encoder(self, default):
+        """Encoder per enc_hook; Decimals as numbers, like DRF's encoder and the other codecs"""
+        encoder = self.encoders.get(default)
+        if encoder is None:
+            encoder = self.encoders[default] = self.msgspec.json.Encoder(enc_hook=default, decimal_format='number')
+        return encoder
+
+    def dumps(self, obj, default=None):
+        return self.dumpb(obj, default=default).decode('utf-8')
+
+    def dumpb(self, obj, default=None):
+        return self.encoder(default).encode(obj)
+
+    def loads(self, data):
+        try:
+            return self.decoder.decode(data)
+        except self.msgspec.DecodeError as e:
+            raise DecodeError(str(e)) from e
+
+
+class MsgpackCodec:
+    """MessagePack codec for the binary chat subprotocol"""
+    name = 'msgpack'
+
+    def __init__(self):
+        import msgpack
+        self.msgpack = msgpack
+
+    def dumpb(self, obj, default=None):
+        return self.msgpack.packb(obj, use_bin_type=True, default=default)
+
+    def loads(self, data):
+        try:
+            return self.msgpack.unpackb(data, raw=False)
+        except (ValueError, TypeError, self.msgpack.UnpackException) as e:
+            raise DecodeError(str(e)) from e
+
+
+CODECS = {
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+    'stdlib': StdlibJSONCodec,
+}
+
+
+@lru_cache(maxsize=None)
+def load_codec(name):
+    """Instantiate a codec by name; 'auto' picks the fastest one installed"""
+    candidates = ['orjson', 'msgspec', 'stdlib'] if name == 'auto' else [name, 'stdlib']
+    for candidate in candidates:
+        try:
+            return CODECS[candidate]()
+        except (ImportError, KeyError):
+            logger.info(f"JSON codec {candidate!r} unavailable, falling back")
+    return StdlibJSONCodec()
+
+
+def get_codec():
+    """Codec selected by settings.JSON_CODEC"""
+    return load_codec(getattr(settings, 'JSON_CODEC', 'auto'))
+
+
+MSGPACK_SUBPROTOCOL = 'chat.msgpack.v1'
+
+
+@lru_cache(maxsize=None)
+def get_msgpack_codec():
+    """Codec for connections that negotiated MSGPACK_SUBPROTOCOL"""
+    return MsgpackCodec()
+
+
+def encode_batch(frames, binary=False):
+    """Wrap already-encoded frames in one {"type": "batch", "events": [...]} frame"""
+    if binary:
+        packer = get_msgpack_codec().msgpack.Packer(use_bin_type=True)
+        return b''.join([
+            packer.pack_map_header(2),
+            packer.pack('type'), packer.pack('batch'),
+            packer.pack('events'), packer.pack_array_header(len(frames)),
+            *frames
+        ])
+    return '{"type":"batch","events":[' + ','.join(frames) + ']}'
+
+
+def encode_broadcast(payload):
+    """Pre-encode a group frame once for every wire format members may use"""
+    encoded = {'text': get_codec().dumps(payload)}
+    if settings.CHAT_MSGPACK_ENABLED:
+        encoded['bytes'] = get_msgpack_codec().dumpb(payload)
+    return encoded
@@ -1,30 +1,56 @@
 # consumers.py
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
-from User.models import Message, Attachment
-import base64
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from User.models import Message, Attachment, Room
+from User.search import InvalidCursor, SearchTimeout, search_messages
+from .attachments import AttachmentBudget, AttachmentTooLarge, open_inline_file
+from .codecs import get_codec, get_msgpack_codec, encode_broadcast, DecodeError, MSGPACK_SUBPROTOCOL
+from .executor import async_read, db_connections, db_task
+from .history_cache import get_history_cache
+from .middleware import authenticate_token, get_query_param, get_scope_token
+from .outbound import OutboundBuffer
+from .presence import get_presence
+from .query_budget import query_budget
+from .throttling import rate_limiter
+from .write_behind import get_message_writer
+from . import metrics
 from datetime import datetime
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
-import jwt
 from django.conf import settings
 import logging
+import uuid
 
-User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Close code telling the client it missed frames and must refetch history
+RESYNC_CLOSE_CODE = 4009
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    # Negotiated subprotocol; None means JSON text frames
+    wire_format = None
+    # Room presence handle, set once this connection has been counted as a member
+    presence = None
+    # Bounded send queue, set once the socket is accepted
+    outbound = None
+
+    @db_connections
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'chat_{self.room_id}'
+
+        if settings.CHAT_MSGPACK_ENABLED and MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', []):
+            self.wire_format = MSGPACK_SUBPROTOCOL
         
-        token = self.scope['query_string'].decode().split('token=')[-1] if 'token=' in self.scope['query_string'].decode() else None
-        
-        self.user = await self.authenticate_user(token)
+        # JWTAuthMiddleware has already verified the token; only consumers
+        # mounted without it (e.g. in tests) verify it here, once
+        self.user = self.scope.get('user')
+        if self.user is None:
+            self.user = await self.authenticate_user(get_scope_token(self.scope))
         
         # FIX: Check authentication first and reject immediately if failed
         if not self.user or not self.user.is_authenticated:
@@ -38,56 +64,89 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept(subprotocol=self.wire_format)
+
+        if settings.CHAT_OUTBOUND_HIGH_WATER:
+            # Clients that understand `batch` frames opt in with ?batch=1
+            batching = settings.CHAT_BATCH_WINDOW_MS and get_query_param(self.scope, 'batch') == '1'
+            self.outbound = OutboundBuffer(
+                self.send,
+                settings.CHAT_OUTBOUND_HIGH_WATER,
+                settings.CHAT_OUTBOUND_OVERFLOW_POLICY,
+                batch_window=settings.CHAT_BATCH_WINDOW_MS / 1000 if batching else 0,
+                batch_max=settings.CHAT_BATCH_MAX_FRAMES if batching else 1
+            )
+            self.outbound.start()
+
+        presence = get_presence()
+        if presence:
+            await presence.join(self.room_id, self.user.id, self.user.name)
+            self.presence = presence
 
         # Now you can send messages after accept()
-        await self.send(text_data=json.dumps({
+        established = {
             'type': 'connection_established',
             'message': 'Connected to chat',
             'user_id': self.user.id,
             'room_id': self.room_id
-        }))
+        }
+        if presence:
+            established['online_users'] = await presence.members(self.room_id)
+        await self.send_frame(established)
 
-        initial_messages = await self.get_messages(limit=50, offset=0)
-        await self.send(text_data=json.dumps({
-            'type': 'message_history',
-            'messages': initial_messages,
-            'total': await self.get_total_messages()
-        }))
+        # Reconnecting clients pass the last seq (or id) they saw and only get what they missed
+        since_seq = get_query_param(self.scope, 'since_seq')
+        since_id = get_query_param(self.scope, 'since_id')
+        if since_seq is not None or since_id is not None:
+            await self.handle_resume({'since_seq': since_seq, 'since_id': since_id})
+        else:
+            await self.send_initial_history()
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_join',
-                'user_id': self.user.id,
-                'user_name': getattr(self.user, "name", self.user.name),
-                'timestamp': datetime.now().isoformat()
-            }
-        )
+        # With presence batching the join goes out in the next presence_delta
+        if not presence:
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                self.build_presence_event('user_join', 'joined')
+            )
         
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
+        if self.outbound:
+            self.outbound.close()
+
         if self.user and self.user.is_authenticated:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'user_leave',
-                    'user_id': self.user.id,
-                    'user_name': getattr(self.user, "name", self.user.name),
-                    'timestamp': datetime.now().isoformat()
-                }
-            )
+            if self.presence:
+                await self.presence.leave(self.room_id, self.user.id, self.user.name)
+            else:
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    self.build_presence_event('user_leave', 'left')
+                )
         
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    @db_connections
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming WebSocket messages"""
         try:
-            data = json.loads(text_data)
+            data = self.decode_frame(text_data, bytes_data)
             message_type = data.get('type', 'message')
+
+            throttled = rate_limiter.check(message_type, self.user.id, self.room_id)
+            if throttled:
+                scope, retry_after = throttled
+                await self.send_frame({
+                    'type': 'error',
+                    'code': 'rate_limited',
+                    'event': message_type,
+                    'scope': scope,
+                    'retry_after': retry_after,
+                    'message': 'Too many requests, slow down'
+                })
+                return
             
             if message_type == 'message':
                 await self.handle_chat_message(data)
@@ -97,18 +156,30 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.handle_fetch_messages(data)
             elif message_type == 'refresh_token':
                 await self.handle_refresh_token(data)
+            elif message_type == 'resume':
+                await self.handle_resume(data)
+            elif message_type == 'search':
+                await self.handle_search(data)
                 
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
+        except DecodeError:
+            await self.send_frame({
                 'type': 'error',
-                'message': 'Invalid JSON format'
-            }))
+                'message': 'Invalid MessagePack format' if self.wire_format else 'Invalid JSON format'
+            })
+        except AttachmentTooLarge as e:
+            await self.send_frame({
+                'type': 'error',
+                'code': 'attachment_too_large',
+                'name': e.name,
+                'limit': e.limit,
+                'message': str(e)
+            })
         except Exception as e:
             logger.info(f"Error in receive: {str(e)}")
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'error',
                 'message': str(e)
-            }))
+            })
 
     async def handle_chat_message(self, data):
         """Handle chat message with attachments"""
@@ -118,129 +189,418 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if not message_text.strip() and not media:
             return
         
-        message = await self.save_message(message_text, media)
+        writer = get_message_writer()
+        if writer:
+            message = await self.queue_message(writer, message_text, media)
+        else:
+            message = await self.save_message(message_text, media)
+        history_cache = get_history_cache()
+        if history_cache:
+            await history_cache.append(self.room_id, message)
         
+        # Encode the outbound frame once here; every member forwards it verbatim
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message_broadcast',
-                'message': message
+                **encode_broadcast(self.build_chat_message_frame(message))
             }
         )
 
+    # Cursor lookup, page, prefetched attachments, room counter
+    @query_budget(4)
     async def handle_fetch_messages(self, data):
         """Handle pagination - fetch older messages"""
         try:
             limit = min(int(data.get('limit', 20)), 50)  # Limit to 50 max
+            before_id = data.get('before_id')
+            before_ts = data.get('before_ts')
+
+            if before_id is not None or before_ts is not None:
+                await self.handle_fetch_messages_before(limit, before_id, before_ts)
+                return
+
             offset = int(data.get('offset', 0))
             
-            messages = await self.get_messages(limit=limit, offset=offset)
+            if offset == 0:
+                messages = await self.get_recent_messages(limit=limit)
+            else:
+                messages = await self.get_messages(limit=limit, offset=offset)
             total = await self.get_total_messages()
             
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'message_history',
                 'messages': messages,
                 'total': total,
                 'offset': offset,
                 'limit': limit,
                 'has_more': offset + len(messages) < total
-            }))
+            })
         except Exception as e:
             logger.info(f"Error fetching messages: {e}")
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'error',
                 'message': 'Failed to load messages'
-            }))
+            })
+
+    async def handle_fetch_messages_before(self, limit, before_id, before_ts):
+        """Keyset pagination - fetch messages older than the (before_ts, before_id) cursor"""
+        try:
+            before_id = int(before_id) if before_id is not None else None
+            before_ts = parse_datetime(before_ts) if before_ts is not None else None
+        except (TypeError, ValueError):
+            before_id = before_ts = None
+
+        if before_id is None and before_ts is None:
+            await self.send_frame({
+                'type': 'error',
+                'message': 'Invalid pagination cursor'
+            })
+            return
+
+        # Fetch one extra row so has_more doesn't need a COUNT(*)
+        messages = await self.get_messages_before(limit + 1, before_id=before_id, before_ts=before_ts)
+        has_more = len(messages) > limit
+        if has_more:
+            messages = messages[1:]
+
+        next_cursor = None
+        if messages:
+            next_cursor = {
+                'before_id': messages[0]['id'],
+                'before_ts': messages[0]['created_at'],
+            }
+
+        await self.send_frame({
+            'type': 'message_history',
+            'messages': messages,
+            'total': await self.get_total_messages(),
+            'limit': limit,
+            'before_id': before_id,
+            'before_ts': before_ts.isoformat() if before_ts else None,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        })
+
+    async def send_initial_history(self):
+        """Send the newest page of messages, as on a fresh connect"""
+        initial_messages = await self.get_recent_messages(limit=50)
+        await self.send_frame({
+            'type': 'message_history',
+            'messages': initial_messages,
+            'total': await self.get_total_messages()
+        })
+
+    # Cache fill, room last_seq, gap read and counter; a resync serves its page from the then-warm cache
+    @query_budget(6)
+    async def handle_resume(self, data):
+        """Send only the messages after the client's last seen seq (or id), or ask it to resync"""
+        limit = settings.CHAT_RESUME_MAX_GAP
+        key = 'seq' if data.get('since_seq') is not None else 'id'
+        try:
+            since = int(data.get(f'since_{key}'))
+        except (TypeError, ValueError):
+            since = None
+
+        messages = None
+        if since is not None:
+            messages = await self.get_messages_since(key, since, limit + 1)
+
+        if messages is None or len(messages) > limit:
+            # Unusable cursor or too far behind: the client drops its copy and starts over
+            await self.send_frame({
+                'type': 'resync_required',
+                f'since_{key}': since
+            })
+            await self.send_initial_history()
+            return
+
+        await self.send_frame({
+            'type': 'message_history',
+            'messages': messages,
+            'total': await self.get_total_messages(),
+            f'since_{key}': since
+        })
+
+    async def get_messages_since(self, key, since, limit):
+        """Messages whose `key` (seq or id) is above `since`, oldest first - from the history cache when it covers the gap"""
+        history_cache = get_history_cache()
+        if history_cache:
+            cached = await self.get_recent_messages(limit=history_cache.size)
+            missed = await self.cached_messages_since(cached, key, since)
+            if missed is not None:
+                return missed[:limit]
+        return await self.get_messages_after(key, since, limit)
+
+    async def cached_messages_since(self, cached, key, since):
+        """The cached messages after `since`, or None unless the cache provably holds every one.
+
+        Their seqs must run without a hole from the client's last seq up to
+        at least the room's committed Room.last_seq; anything else goes to the DB.
+        """
+        # Entries cached before seq existed can't be checked
+        if not cached or any(msg.get('seq') is None for msg in cached):
+            return None
+        if key == 'seq':
+            last_seen = since
+        else:
+            last_seen = next((msg['seq'] for msg in cached if msg.get('id') == since), None)
+            if last_seen is None:
+                return None
+        if cached[0]['seq'] > last_seen + 1:
+            return None
+
+        missed = [msg for msg in cached if msg['seq'] > last_seen]
+        if [msg['seq'] for msg in missed] != list(range(last_seen + 1, last_seen + 1 + len(missed))):
+            return None
+        newest = missed[-1]['seq'] if missed else last_seen
+        if newest < await self.get_room_last_seq():
+            return None
+        return missed
+
+    # SET LOCAL, matches and prefetched attachments, inside a savepoint when nested
+    @query_budget(5)
+    async def handle_search(self, data):
+        """Full-text search over this room's messages, best match first, one page per event"""
+        query = str(data.get('query') or '').strip()
+        if not query:
+            await self.send_frame({
+                'type': 'error',
+                'code': 'invalid_search',
+                'message': 'Search query is required'
+            })
+            return
+
+        try:
+            limit = max(1, min(int(data.get('limit', 20)), settings.CHAT_SEARCH_MAX_RESULTS))
+        except (TypeError, ValueError):
+            limit = 20
+        cursor = data.get('cursor')
+
+        try:
+            messages, next_cursor = await self.search_messages(query, limit, cursor)
+        except InvalidCursor as e:
+            await self.send_frame({
+                'type': 'error',
+                'code': 'invalid_search',
+                'message': str(e)
+            })
+            return
+        except SearchTimeout as e:
+            await self.send_frame({
+                'type': 'error',
+                'code': 'search_timeout',
+                'message': str(e)
+            })
+            return
+
+        await self.send_frame({
+            'type': 'search_results',
+            'query': query,
+            'messages': messages,
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        })
 
     async def handle_refresh_token(self, data):
         """Handle token refresh"""
         refresh_token = data.get('refresh_token')
         
         if not refresh_token:
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'token_error',
                 'message': 'No refresh token provided'
-            }))
+            })
             return
         
         try:
             new_tokens = await self.refresh_access_token(refresh_token)
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'token_refreshed',
                 'access_token': new_tokens['access'],
                 'refresh_token': new_tokens['refresh']
-            }))
+            })
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'token_error',
                 'message': str(e)
-            }))
+            })
+
+    async def queue_message(self, writer, message_text, media):
+        """Hand a message to the write-behind pipeline and return its payload for broadcast"""
+        # Only messages with media touch the DB here; plain text is a seq bump
+        media_list = await self.prepare_attachments(media) if media else []
+        seq = await writer.allocate_seq(self.room_id)
+        write_id = uuid.uuid4().hex
+        await writer.submit({
+            'room_id': self.room_id,
+            'sender_id': self.user.id,
+            'seq': seq,
+            'write_id': write_id,
+            'message': message_text,
+            'attachment_ids': [item['id'] for item in media_list]
+        })
+        # The row id is only known once the batch is written. The messages_stored
+        # frame sent after the flush carries it, and the final seq, keyed on write_id
+        return {
+            'id': None,
+            'write_id': write_id,
+            'seq': seq,
+            'message': message_text,
+            'sender': 'user',
+            'sender_id': self.user.id,
+            'sender_name': getattr(self.user, "name", self.user.name),
+            'created_at': timezone.now().isoformat(),
+            'media': media_list
+        }
+
+    async def get_recent_messages(self, limit):
+        """Newest messages for the room, served from the history cache when warm"""
+        history_cache = get_history_cache()
+        if not history_cache or limit > history_cache.size:
+            return await self.get_messages(limit=limit, offset=0)
+
+        messages = await history_cache.get_recent(self.room_id, limit)
+        if messages is None:
+            generation = await history_cache.generation(self.room_id)
+            messages = await self.get_messages(limit=history_cache.size, offset=0)
+            await history_cache.fill(self.room_id, messages, generation)
+            messages = messages[-limit:] if limit else []
+        return messages
+
+    # Frame encoding - JSON goes through the codec selected by settings.JSON_CODEC,
+    # connections on MSGPACK_SUBPROTOCOL get binary MessagePack frames
+    def encode_frame(self, payload):
+        return get_codec().dumps(payload)
+
+    def decode_frame(self, text_data=None, bytes_data=None):
+        if self.wire_format == MSGPACK_SUBPROTOCOL and bytes_data is not None:
+            data = get_msgpack_codec().loads(bytes_data)
+        else:
+            data = get_codec().loads(text_data if text_data is not None else bytes_data)
+        if not isinstance(data, dict):
+            raise DecodeError('Frame must be an object')
+        return data
+
+    async def send_frame(self, payload, ephemeral=False):
+        if self.wire_format == MSGPACK_SUBPROTOCOL:
+            await self.push(ephemeral, bytes_data=get_msgpack_codec().dumpb(payload))
+        else:
+            await self.push(ephemeral, text_data=self.encode_frame(payload))
+
+    async def send_encoded(self, event, ephemeral=False):
+        """Forward a pre-encoded group frame in this connection's wire format"""
+        if self.wire_format != MSGPACK_SUBPROTOCOL:
+            await self.push(ephemeral, text_data=event['text'])
+        elif 'bytes' in event:
+            await self.push(ephemeral, bytes_data=event['bytes'])
+        else:
+            await self.send_frame(get_codec().loads(event['text']), ephemeral)
+
+    async def push(self, ephemeral=False, **frame):
+        """Send a frame through the outbound buffer; evict the connection if it overflows"""
+        if self.outbound is None:
+            await self.send(**frame)
+        elif not self.outbound.put(frame, ephemeral):
+            await self.evict()
+
+    async def evict(self):
+        """Drop a consumer that can't keep up; the client refetches history on reconnect"""
+        logger.info(f"Closing slow consumer {self.channel_name} in room {self.room_id}")
+        metrics.increment('chat_slow_consumer_evictions_total')
+        self.outbound.close()
+        await self.close(code=RESYNC_CLOSE_CODE)
 
     # Broadcast handlers
+    # Group events carry the frame pre-encoded in 'text'/'bytes'; the dict form
+    # is still accepted from workers running an older release.
     async def chat_message_broadcast(self, event):
         """Send chat message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'id': event['message']['id'],
-            'username': event['message']['sender_name'],
-            'message': event['message']['message'],
-            'media': event['message'].get('media', []),
-            'sender_id': event['message']['sender_id'],
-            'timestamp': event['message']['created_at']
-        }))
+        if 'text' in event:
+            await self.send_encoded(event)
+            return
+        await self.send_frame(self.build_chat_message_frame(event['message']))
+
+    async def messages_stored(self, event):
+        """Send write-behind row ids and final seqs to WebSocket"""
+        await self.send_encoded(event)
 
     async def user_join(self, event):
         """Send user join notification"""
-        if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'user_join',
-                'message': f"{event['user_name']} joined the chat",
-                'user_id': event['user_id'],
-                'user_name': event['user_name'],
-                'timestamp': event['timestamp']
-            }))
+        if event['user_id'] == self.user.id:
+            return
+        if 'text' in event:
+            await self.send_encoded(event, ephemeral=True)
+            return
+        await self.send_frame({
+            'type': 'user_join',
+            'message': f"{event['user_name']} joined the chat",
+            'user_id': event['user_id'],
+            'user_name': event['user_name'],
+            'timestamp': event['timestamp']
+        }, ephemeral=True)
 
     async def user_leave(self, event):
         """Send user leave notification"""
-        if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'user_leave',
-                'message': f"{event['user_name']} left the chat",
-                'user_id': event['user_id'],
-                'user_name': event['user_name'],
-                'timestamp': event['timestamp']
-            }))
+        if event['user_id'] == self.user.id:
+            return
+        if 'text' in event:
+            await self.send_encoded(event, ephemeral=True)
+            return
+        await self.send_frame({
+            'type': 'user_leave',
+            'message': f"{event['user_name']} left the chat",
+            'user_id': event['user_id'],
+            'user_name': event['user_name'],
+            'timestamp': event['timestamp']
+        }, ephemeral=True)
+
+    async def presence_delta(self, event):
+        """Send coalesced join/leave changes"""
+        # Like user_join/user_leave, don't echo a delta that is only about ourselves
+        if event['user_ids'] != [self.user.id]:
+            await self.send_encoded(event, ephemeral=True)
+
+    def build_chat_message_frame(self, message):
+        """Outbound chat_message frame for a saved message payload"""
+        frame = {
+            'type': 'chat_message',
+            'id': message['id'],
+            'seq': message.get('seq'),
+            'username': message['sender_name'],
+            'message': message['message'],
+            'media': message.get('media', []),
+            'sender_id': message['sender_id'],
+            'timestamp': message['created_at']
+        }
+        if message.get('write_id'):
+            # Write-behind: id is None until messages_stored names it
+            frame['write_id'] = message['write_id']
+        return frame
+
+    def build_presence_event(self, event_type, verb):
+        """Group event for user_join/user_leave with the frame pre-encoded"""
+        user_name = getattr(self.user, "name", self.user.name)
+        frame = {
+            'type': event_type,
+            'message': f"{user_name} {verb} the chat",
+            'user_id': self.user.id,
+            'user_name': user_name,
+            'timestamp': datetime.now().isoformat()
+        }
+        return {
+            'type': event_type,
+            'user_id': self.user.id,
+            **encode_broadcast(frame)
+        }
 
     # Database operations
     async def authenticate_user(self, token):
-        """Authenticate user from JWT token with better error handling"""
-        if not token:
-            return None
-        
-        try:
-            # Try to decode without verification first to check expiration
-            try:
-                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'], options={"verify_exp": False})
-            except jwt.DecodeError:
-                return None
-            
-            # Check expiration manually
-            from datetime import datetime
-            exp = payload.get('exp')
-            if exp and datetime.fromtimestamp(exp) < datetime.now():
-                return None
-            
-            # Now verify properly
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            user = await database_sync_to_async(User.objects.get)(id=user_id)
-            return user
-            
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, User.DoesNotExist) as e:
-            logger.info(f"Token authentication error: {e}")
-            return None
+        """Authenticate user from JWT token - one signature check, cached user lookup"""
+        return await authenticate_token(token)
 
-    @database_sync_to_async
+    @db_task('read')
     def refresh_access_token(self, refresh_token_str):
         """Refresh the access token"""
         try:
@@ -252,54 +612,28 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except TokenError as e:
             raise Exception(f"Token refresh failed: {str(e)}")
 
-    @database_sync_to_async
+    @db_task('write')
     def save_message(self, message_text, media):
-        """Save message to database with media attachments"""
-        message = Message.objects.create(
-            room_id=self.room_id,
-            sender=self.user,
-            message=message_text,
-            sender_type='user'
-        )
-        
-        media_list = []
-        for media_item in media:
-            try:
-                file_data = media_item.get('data', '')
-                file_name = media_item.get('name', 'attachment')
-                file_type = media_item.get('type', 'application/octet-stream')
-                
-                # Decode base64
-                if isinstance(file_data, str) and file_data.startswith('data:'):
-                    try:
-                        format_part, filestr = file_data.split(';base64,')
-                        file_data = base64.b64decode(filestr)
-                    except (ValueError, Exception) as e:
-                        logger.info(f"Error decoding base64: {e}")
-                        continue
-                
-                # Create attachment
-                attachment = Attachment.objects.create(
-                    message=message,
-                    file=ContentFile(file_data, name=file_name),
-                    file_type=file_type,
-                    original_filename=file_name,
-                    file_size=len(file_data) if isinstance(file_data, bytes) else media_item.get('size', 0)
+        """Save a message and all of its attachments in one transaction"""
+        # Files go to storage first so the transaction only holds row inserts
+        files = self.write_attachment_files(media)
+        try:
+            # Insert, attachments and Room.message_count bump (User.signals) commit together
+            with transaction.atomic():
+                message = Message.objects.create(
+                    room_id=self.room_id,
+                    sender_id=self.user.id,
+                    message=message_text,
+                    sender_type='user'
                 )
-                
-                media_list.append({
-                    'id': attachment.id,
-                    'name': attachment.original_filename,
-                    'type': attachment.file_type,
-                    'size': attachment.file_size,
-                    'url': attachment.file.url if attachment.file else None
-                })
-            except Exception as e:
-                logger.info(f"Error saving attachment: {e}")
-                continue
-        
+                media_list = self.insert_attachments(media, files, message)
+        except Exception:
+            self.delete_attachment_files(files)
+            raise
+
         return {
             'id': message.id,
+            'seq': message.seq,
             'message': message.message,
             'sender': 'user',
             'sender_id': self.user.id,
@@ -308,39 +642,194 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'media': media_list
         }
 
-    @database_sync_to_async
-    def get_messages(self, limit, offset):
+    @db_task('write')
+    def prepare_attachments(self, media):
+        """Store a write-behind message's attachments unclaimed; the writer claims them"""
+        files = self.write_attachment_files(media)
+        try:
+            with transaction.atomic():
+                return self.insert_attachments(media, files)
+        except Exception:
+            self.delete_attachment_files(files)
+            raise
+
+    def write_attachment_files(self, media):
+        """Decode inline media and stream it to storage, returning unsaved Attachments.
+
+        Raises AttachmentTooLarge - after removing anything already written -
+        as soon as a file or the message as a whole goes over its byte limit.
+        """
+        attachments = []
+        budget = AttachmentBudget()
+        for media_item in media:
+            try:
+                if not isinstance(media_item, dict):
+                    continue
+                # Attachments uploaded out-of-band are already stored
+                if media_item.get('id') and not media_item.get('data'):
+                    continue
+
+                file_name = media_item.get('name', 'attachment')
+                file_type = media_item.get('type', 'application/octet-stream')
+
+                try:
+                    content, size = open_inline_file(file_name, media_item.get('data', ''), budget)
+                except AttachmentTooLarge:
+                    raise
+                except ValueError as e:
+                    logger.info(f"Error decoding base64: {e}")
+                    continue
+
+                attachment = Attachment(
+                    room_id=self.room_id,
+                    uploaded_by_id=self.user.id,
+                    file_type=file_type,
+                    original_filename=file_name,
+                    file_size=size
+                )
+                with content:
+                    attachment.file.save(file_name, content, save=False)
+                attachments.append(attachment)
+            except AttachmentTooLarge:
+                self.delete_attachment_files(attachments)
+                raise
+            except Exception as e:
+                logger.info(f"Error saving attachment: {e}")
+                continue
+        return attachments
+
+    def delete_attachment_files(self, attachments):
+        """Remove stored files whose rows never got committed"""
+        for attachment in attachments:
+            try:
+                attachment.file.delete(save=False)
+            except Exception as e:
+                logger.info(f"Error removing orphaned attachment file: {e}")
+
+    def insert_attachments(self, media, files, message=None):
+        """Claim referenced uploads and bulk-insert stored files, returning media items.
+
+        Runs inside the caller's transaction. Without a message the uploads
+        are only checked and the new rows stay unclaimed.
+        """
+        media_list = []
+
+        # Attachments uploaded out-of-band via the HTTP API are referenced by id
+        upload_ids = [
+            item['id'] for item in media
+            if isinstance(item, dict) and item.get('id') and not item.get('data')
+        ]
+        if upload_ids:
+            uploads = list(Attachment.objects.select_for_update().filter(
+                id__in=upload_ids,
+                room_id=self.room_id,
+                uploaded_by_id=self.user.id,
+                message__isnull=True
+            ).exclude(file=''))
+            if message is not None and uploads:
+                Attachment.objects.filter(id__in=[att.id for att in uploads]).update(message=message)
+            media_list.extend(self.serialize_attachment(att) for att in uploads)
+
+        for attachment in files:
+            attachment.message = message
+        media_list.extend(self.serialize_attachment(att) for att in Attachment.objects.bulk_create(files))
+        return media_list
+
+    # Reads use Django's async queryset API; connect() and receive() are wrapped in
+    # db_connections, which does the connection cleanup that API skips. Writes and
+    # search need transaction.atomic(), so they stay synchronous on the db_task pools.
+    # Message reads defer search_vector: the tsvector is only ever used inside SQL.
+    @async_read
+    async def get_messages(self, limit, offset):
         """Fetch messages from database with pagination"""
         messages = Message.objects.filter(
             room_id=self.room_id
-        ).select_related('sender').prefetch_related('attachments').order_by('-created_at')[offset:offset + limit]
+        ).select_related('sender').prefetch_related('attachments').defer('search_vector').order_by('-created_at', '-id')[offset:offset + limit]
         
         # Convert to list and reverse for chronological order
-        messages_list = list(messages)
+        messages_list = [msg async for msg in messages]
         messages_list.reverse()  # Oldest first for prepending
         
-        return [{
+        return [self.serialize_message(msg) for msg in messages_list]
+
+    @async_read
+    async def get_messages_before(self, limit, before_id=None, before_ts=None):
+        """Fetch messages older than a (created_at, id) cursor using the room index"""
+        messages = Message.objects.filter(room_id=self.room_id)
+
+        if before_id is not None and before_ts is None:
+            before_ts = await Message.objects.filter(
+                room_id=self.room_id, id=before_id
+            ).values_list('created_at', flat=True).afirst()
+            if before_ts is None:
+                return []
+
+        if before_id is not None:
+            messages = messages.filter(
+                Q(created_at__lt=before_ts) | Q(created_at=before_ts, id__lt=before_id)
+            )
+        else:
+            messages = messages.filter(created_at__lt=before_ts)
+
+        messages_list = [
+            msg async for msg in
+            messages.select_related('sender').prefetch_related('attachments').defer('search_vector').order_by('-created_at', '-id')[:limit]
+        ]
+        messages_list.reverse()  # Oldest first for prepending
+
+        return [self.serialize_message(msg) for msg in messages_list]
+
+    @async_read
+    async def get_messages_after(self, key, after, limit):
+        """Fetch up to `limit` messages whose `key` (seq or id) is above `after`, oldest first"""
+        messages = Message.objects.filter(room_id=self.room_id, **{f'{key}__gt': after})
+        # seq walks the (room, seq) unique index; ids follow the (room, created_at, id) one
+        ordering = ('seq',) if key == 'seq' else ('created_at', 'id')
+        messages = messages.select_related('sender').prefetch_related('attachments').defer('search_vector').order_by(*ordering)[:limit]
+
+        return [self.serialize_message(msg) async for msg in messages]
+
+    @db_task('read')
+    def search_messages(self, query, limit, cursor):
+        """Ranked search page as payload dicts - synchronous, its time budget needs transaction.atomic()"""
+        messages, next_cursor = search_messages(self.room_id, query, limit, cursor)
+        return [{**self.serialize_message(msg), 'rank': msg.rank} for msg in messages], next_cursor
+
+    def serialize_message(self, msg):
+        """Convert a Message with prefetched sender/attachments to a payload dict"""
+        return {
             'id': msg.id,
+            'seq': msg.seq,
             'message': msg.message,
             'sender': msg.sender_type,
             'sender_id': msg.sender.id,
             'sender_name': getattr(msg.sender, "name", msg.sender.name),
             'created_at': msg.created_at.isoformat(),
-            'media': [{
-                'id': att.id,
-                'name': att.original_filename,
-                'type': att.file_type,
-                'size': att.file_size,
-                'url': att.file.url if att.file else None
-            } for att in msg.attachments.all()]
-        } for msg in messages_list]
-
-    @database_sync_to_async
-    def get_total_messages(self):
-        """Get total message count for pagination"""
-        return Message.objects.filter(room_id=self.room_id).count()
-
-    @database_sync_to_async
+            'media': [self.serialize_attachment(att) for att in msg.attachments.all()]
+        }
+
+    def serialize_attachment(self, att):
+        """Convert an Attachment to a chat_message media item"""
+        return {
+            'id': att.id,
+            'name': att.original_filename,
+            'type': att.file_type,
+            'size': att.file_size,
+            'url': att.file.url if att.file else None
+        }
+
+    @async_read
+    async def get_room_last_seq(self):
+        """Newest committed Message.seq in the room"""
+        return await Room.objects.filter(id=self.room_id).values_list('last_seq', flat=True).afirst() or 0
+
+    @async_read
+    async def get_total_messages(self):
+        """Get total message count for pagination from the maintained room counter"""
+        total = await Room.objects.filter(id=self.room_id).values_list('message_count', flat=True).afirst()
+        return total or 0
+
+    @db_task('write')
     def mark_message_read(self, message_id):
         """Mark message as read"""
         try:
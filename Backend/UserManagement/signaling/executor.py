@@ -0,0 +1,110 @@
+# executor.py
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from . import metrics
+
+
+class DBExecutor:
+    """Named thread pool for synchronous consumer DB work, with per-method metrics.
+
+    Records chat_db_queue_wait_seconds (submitted until a thread picks the
+    call up), chat_db_execution_seconds and the chat_db_in_flight gauge,
+    labelled by pool and method. Calls still go through
+    database_sync_to_async, so connections are cleaned up as before; with
+    no workers they share channels' default executor.
+    """
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.pool = None
+        if max_workers:
+            self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'chat-db-{name}')
+
+    async def run(self, method, func, *args, **kwargs):
+        labels = {'pool': self.name, 'method': method}
+        submitted = time.monotonic()
+
+        def call():
+            started = time.monotonic()
+            metrics.observe('chat_db_queue_wait_seconds', started - submitted, **labels)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe('chat_db_execution_seconds', time.monotonic() - started, **labels)
+
+        if self.pool is None:
+            runner = database_sync_to_async(call)
+        else:
+            runner = database_sync_to_async(call, thread_sensitive=False, executor=self.pool)
+
+        metrics.adjust_gauge('chat_db_in_flight', 1, **labels)
+        try:
+            return await runner()
+        finally:
+            metrics.adjust_gauge('chat_db_in_flight', -1, **labels)
+
+
+@lru_cache(maxsize=None)
+def load_db_executor(name, max_workers):
+    return DBExecutor(name, max_workers)
+
+
+def get_db_executor(name):
+    """The 'read' or 'write' pool, sized by CHAT_DB_READ_WORKERS / CHAT_DB_WRITE_WORKERS"""
+    workers = settings.CHAT_DB_READ_WORKERS if name == 'read' else settings.CHAT_DB_WRITE_WORKERS
+    return load_db_executor(name, workers)
+
+
+def db_task(pool):
+    """Decorator: run a sync DB function on the named pool, like database_sync_to_async"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await get_db_executor(pool).run(func.__name__, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+
+# Thread-sensitive, like Django's async ORM methods, so it cleans up the
+# connections those methods actually use
+aclose_old_connections = sync_to_async(close_old_connections)
+
+
+def db_connections(func):
+    """Decorator: close_old_connections() around an async handler that uses the async ORM.
+
+    Django does this around every request and database_sync_to_async around
+    every call, but the async queryset API never does. Without it, CONN_MAX_AGE
+    and CONN_HEALTH_CHECKS are not enforced, and a connection broken by a
+    database restart stays in use.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        await aclose_old_connections()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            await aclose_old_connections()
+    return wrapper
+
+
+def async_read(func):
+    """Decorator: in-flight and execution metrics for a native async ORM read, pool 'async'"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        labels = {'pool': 'async', 'method': func.__name__}
+        started = time.monotonic()
+        metrics.adjust_gauge('chat_db_in_flight', 1, **labels)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            metrics.adjust_gauge('chat_db_in_flight', -1, **labels)
+            metrics.observe('chat_db_execution_seconds', time.monotonic() - started, **labels)
+    return wrapper
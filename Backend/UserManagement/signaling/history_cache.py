@@ -0,0 +1,258 @@
+# history_cache.py
+import logging
+from bisect import insort
+from collections import OrderedDict
+from functools import lru_cache
+from django.conf import settings
+from django.db import transaction
+from .codecs import get_codec
+
+logger = logging.getLogger(__name__)
+
+
+def seq_of(message):
+    return message.get('seq') or 0
+
+
+class LocalHistoryCache:
+    """In-process buffer of the newest messages per room, kept in seq order,
+    with LRU eviction of whole rooms.
+
+    Only coherent when a single worker serves a room - use the Redis
+    backend when running several Daphne processes.
+    """
+
+    def __init__(self, size, max_rooms):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.rooms = OrderedDict()
+        self.generations = {}
+
+    async def get_recent(self, room_id, limit):
+        """Return the newest `limit` messages oldest-first, or None on a miss"""
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            return None
+        self.rooms.move_to_end(room_id)
+        return buffer[-limit:] if limit else []
+
+    async def generation(self, room_id):
+        """Token to pass to fill(); taken before reading the DB after a miss"""
+        return self.generations.get(room_id, 0)
+
+    async def fill(self, room_id, messages, generation):
+        # An append to the cold room since `generation` may be missing from `messages`
+        if generation != self.generations.get(room_id, 0):
+            return
+        self.rooms[room_id] = sorted(messages, key=seq_of)[-self.size:]
+        self.rooms.move_to_end(room_id)
+        while len(self.rooms) > self.max_rooms:
+            self.rooms.popitem(last=False)
+
+    async def append(self, room_id, message):
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            # Cold room: any fill already reading the DB could miss this message
+            self.generations[room_id] = self.generations.get(room_id, 0) + 1
+            return
+        # Same seq already cached (the fill read it from the DB): keep one copy
+        buffer[:] = [msg for msg in buffer if seq_of(msg) != seq_of(message)]
+        insort(buffer, message, key=seq_of)
+        del buffer[:-self.size]
+
+    async def resolve(self, room_id, stored):
+        """Give cached write-behind messages their row id and final seq, matched on write_id"""
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            return
+        by_write_id = {item['write_id']: item for item in stored}
+        resolved = []
+        for msg in buffer:
+            item = by_write_id.get(msg.get('write_id'))
+            resolved.append({**msg, 'id': item['id'], 'seq': item['seq']} if item else msg)
+        buffer[:] = sorted(resolved, key=seq_of)
+
+    def invalidate(self, room_ids):
+        """Drop rooms whose messages were deleted; sync, for delete paths"""
+        for room_id in room_ids:
+            self.rooms.pop(room_id, None)
+            # A fill that read the DB before the delete must not cache the old rows
+            self.generations[room_id] = self.generations.get(room_id, 0) + 1
+
+    async def clear(self):
+        self.rooms.clear()
+        self.generations.clear()
+
+
+# KEYS: entries, generation. ARGV: expected generation, ttl, size, then score/member pairs.
+# Refuses to fill if an append bumped the generation after the caller's miss.
+FILL_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZADD', KEYS[1], unpack(ARGV, 4))
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[3]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS: entries, generation. ARGV: score, member, size, ttl.
+# Warm rooms get the message in seq order; cold ones invalidate in-flight fills.
+APPEND_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[3]) + 1))
+    return 1
+end
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 0
+"""
+
+
+# KEYS: entries. ARGV: old member, new score, new member triples.
+# Members trimmed or replaced since they were read are left alone.
+RESOLVE_SCRIPT = """
+for i = 1, #ARGV, 3 do
+    if redis.call('ZREM', KEYS[1], ARGV[i]) == 1 then
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i + 2])
+    end
+end
+return 1
+"""
+
+
+class RedisHistoryCache:
+    """Redis sorted set per room scored by seq, trimmed to the newest `size` entries.
+
+    Fill and append are Lua scripts, so each is atomic. Entries land in seq
+    order whichever worker appends them. An append to a cold room bumps
+    the room's generation, which makes a fill started before it a no-op
+    instead of caching a list without that message. The TTL is only set
+    on fill, so even a busy room is rebuilt from the DB every `ttl` seconds.
+    """
+
+    def __init__(self, url, size, ttl):
+        import redis
+        import redis.asyncio
+        self.redis = redis.asyncio.Redis.from_url(url)
+        # Deletes run in sync code, outside the event loop the async client is bound to
+        self.sync_redis = redis.Redis.from_url(url)
+        self.size = size
+        self.ttl = ttl
+
+    def key(self, room_id):
+        return f'chat:history:{room_id}'
+
+    def generation_key(self, room_id):
+        return f'chat:history:gen:{room_id}'
+
+    async def get_recent(self, room_id, limit):
+        """Return the newest `limit` messages oldest-first, or None on a miss"""
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.exists(self.key(room_id))
+            pipe.zrange(self.key(room_id), -limit, -1)
+            exists, items = await pipe.execute()
+        except Exception as e:
+            logger.info(f"History cache read failed: {e}")
+            return None
+        if not exists:
+            return None
+        codec = get_codec()
+        return [codec.loads(item) for item in items] if limit else []
+
+    async def generation(self, room_id):
+        """Token to pass to fill(); taken before reading the DB after a miss"""
+        try:
+            return int(await self.redis.get(self.generation_key(room_id)) or 0)
+        except Exception as e:
+            logger.info(f"History cache read failed: {e}")
+            return None
+
+    async def fill(self, room_id, messages, generation):
+        if not messages or generation is None:
+            return
+        codec = get_codec()
+        pairs = []
+        for msg in messages[-self.size:]:
+            pairs.extend((seq_of(msg), codec.dumpb(msg)))
+        try:
+            await self.redis.eval(
+                FILL_SCRIPT, 2, self.key(room_id), self.generation_key(room_id),
+                generation, self.ttl, self.size, *pairs
+            )
+        except Exception as e:
+            logger.info(f"History cache fill failed: {e}")
+
+    async def append(self, room_id, message):
+        try:
+            await self.redis.eval(
+                APPEND_SCRIPT, 2, self.key(room_id), self.generation_key(room_id),
+                seq_of(message), get_codec().dumpb(message), self.size, self.ttl
+            )
+        except Exception as e:
+            logger.info(f"History cache append failed: {e}")
+
+    async def resolve(self, room_id, stored):
+        """Give cached write-behind messages their row id and final seq, matched on write_id"""
+        codec = get_codec()
+        by_write_id = {item['write_id']: item for item in stored}
+        try:
+            triples = []
+            for raw in await self.redis.zrange(self.key(room_id), 0, -1):
+                msg = codec.loads(raw)
+                item = by_write_id.get(msg.get('write_id'))
+                if item:
+                    triples.extend((raw, item['seq'], codec.dumpb({**msg, 'id': item['id'], 'seq': item['seq']})))
+            if triples:
+                await self.redis.eval(RESOLVE_SCRIPT, 1, self.key(room_id), *triples)
+        except Exception as e:
+            logger.info(f"History cache resolve failed: {e}")
+
+    def invalidate(self, room_ids):
+        """Drop rooms whose messages were deleted and refuse fills started before"""
+        try:
+            pipe = self.sync_redis.pipeline(transaction=True)
+            for room_id in room_ids:
+                pipe.delete(self.key(room_id))
+                pipe.incr(self.generation_key(room_id))
+                pipe.expire(self.generation_key(room_id), self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.info(f"History cache invalidation failed: {e}")
+
+    async def clear(self):
+        async for key in self.redis.scan_iter(match='chat:history:*'):
+            await self.redis.delete(key)
+
+
+@lru_cache(maxsize=None)
+def load_history_cache(backend, size, max_rooms, ttl, url):
+    if backend == 'redis':
+        return RedisHistoryCache(url, size, ttl)
+    if backend == 'local':
+        return LocalHistoryCache(size, max_rooms)
+    return None
+
+
+def invalidate_history(room_ids):
+    """Evict rooms from the history cache once the transaction deleting their messages commits"""
+    cache = get_history_cache()
+    room_ids = list(room_ids)
+    if cache and room_ids:
+        # After commit, so no reader can re-fill the cache with the deleted rows
+        transaction.on_commit(lambda: cache.invalidate(room_ids))
+
+
+def get_history_cache():
+    """History cache selected by settings.CHAT_HISTORY_CACHE_BACKEND, or None when disabled"""
+    return load_history_cache(
+        settings.CHAT_HISTORY_CACHE_BACKEND,
+        settings.CHAT_HISTORY_CACHE_SIZE,
+        settings.CHAT_HISTORY_CACHE_ROOMS,
+        settings.CHAT_HISTORY_CACHE_TTL,
+        settings.CHAT_HISTORY_CACHE_URL,
+    )
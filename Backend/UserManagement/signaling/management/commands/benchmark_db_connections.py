@@ -0,0 +1,57 @@
+import statistics
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+from django.db.utils import ConnectionHandler
+
+
+class Command(BaseCommand):
+    help = "Compare per-query latency over fresh, persistent and pooled database connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        base = dict(settings.DATABASES[options['database']])
+        options_without_pool = {k: v for k, v in base.get('OPTIONS', {}).items() if k != 'pool'}
+        modes = {
+            # What a request or consumer call pays when nothing is reused
+            'fresh': {**base, 'CONN_MAX_AGE': 0, 'OPTIONS': options_without_pool},
+            'persistent': {**base, 'CONN_MAX_AGE': None, 'CONN_HEALTH_CHECKS': True, 'OPTIONS': options_without_pool},
+            'pool': {**base, 'CONN_MAX_AGE': 0, 'OPTIONS': {**options_without_pool, 'pool': True}},
+        }
+
+        self.stdout.write(f"{'mode':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, config in modes.items():
+            try:
+                timings = self.run(config, options['iterations'])
+            except (ImproperlyConfigured, ImportError) as e:
+                self.stdout.write(f"{name:<12}skipped: {e}")
+                continue
+            timings.sort()
+            self.stdout.write(
+                f"{name:<12}{statistics.mean(timings):>10.3f}{statistics.median(timings):>10.3f}"
+                f"{timings[int(len(timings) * 0.95) - 1]:>10.3f}"
+            )
+
+    def run(self, config, iterations):
+        """Time `iterations` round trips, each followed by Django's end-of-request connection handling"""
+        connection = ConnectionHandler({'default': config})['default']
+        timings = []
+        try:
+            for _ in range(iterations):
+                started = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                # What request_finished and database_sync_to_async do after every call:
+                # closes (fresh), returns to the pool (pool) or keeps (persistent)
+                connection.close_if_unusable_or_obsolete()
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+        return timings
@@ -0,0 +1,85 @@
+# metrics.py
+import threading
+from collections import Counter
+
+# In-process counters and gauges for the chat consumers; read them with snapshot(),
+# or render() for the Prometheus text format the /metrics view serves
+_lock = threading.Lock()
+_counters = Counter()
+_gauges = {}
+# Names recorded through observe(), exported as summaries rather than counters
+_summaries = set()
+
+
+def label_key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+def increment(name, amount=1, **labels):
+    with _lock:
+        _counters[label_key(name, labels)] += amount
+
+
+def observe(name, value, **labels):
+    """Record one sample as Prometheus summary-style _count/_sum counters"""
+    with _lock:
+        _summaries.add(name)
+        _counters[label_key(f'{name}_count', labels)] += 1
+        _counters[label_key(f'{name}_sum', labels)] += value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[label_key(name, labels)] = value
+
+
+def adjust_gauge(name, amount, **labels):
+    with _lock:
+        key = label_key(name, labels)
+        _gauges[key] = _gauges.get(key, 0) + amount
+
+
+def snapshot():
+    """Copy of every counter and gauge, keyed by Prometheus-style series name"""
+    with _lock:
+        return {'counters': dict(_counters), 'gauges': dict(_gauges)}
+
+
+def metric_name(key):
+    """Metric family of a series key: its name without labels or summary suffix"""
+    name = key.partition('{')[0]
+    for suffix in ('_count', '_sum'):
+        if name.endswith(suffix) and name[:-len(suffix)] in _summaries:
+            return name[:-len(suffix)]
+    return name
+
+
+def render():
+    """Every series in the Prometheus text exposition format.
+
+    Values are this process's only: each ASGI worker keeps its own
+    registry, so scrape every worker as a separate target and aggregate
+    in the query rather than expecting one worker to report the total.
+    """
+    with _lock:
+        series = [(key, value, 'counter') for key, value in _counters.items()]
+        series += [(key, value, 'gauge') for key, value in _gauges.items()]
+        families = {}
+        for key, value, kind in series:
+            name = metric_name(key)
+            kind = 'summary' if name in _summaries else kind
+            families.setdefault((name, kind), []).append((key, value))
+    lines = []
+    for (name, kind), samples in sorted(families.items()):
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{key} {value}' for key, value in sorted(samples))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _summaries.clear()
@@ -1,35 +1,104 @@
+import time
+import logging
+from collections import OrderedDict
+from urllib.parse import parse_qs
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from jwt import decode as jwt_decode, ExpiredSignatureError, InvalidTokenError
+from jwt import decode as jwt_decode, InvalidTokenError
 from django.conf import settings
+from .executor import db_connections
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+class UserPrincipal:
+    """Lightweight authenticated user placed on the WebSocket scope"""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, name, email):
+        self.id = id
+        self.pk = id
+        self.name = name
+        self.email = email
+
+    def __str__(self):
+        return self.name
+
+
+class PrincipalCache:
+    """TTL-bounded LRU of user principals keyed by user id"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at < time.monotonic():
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return principal
+
+    def set(self, principal):
+        self.entries[principal.id] = (time.monotonic() + settings.CHAT_USER_CACHE_TTL, principal)
+        self.entries.move_to_end(principal.id)
+        while len(self.entries) > settings.CHAT_USER_CACHE_SIZE:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+@db_connections
+async def get_user(user_id):
+    try:
+        user = await User.objects.filter(id=user_id).values('id', 'name', 'email').afirst()
+    except (TypeError, ValueError):
+        return None
+    return UserPrincipal(**user) if user else None
+
+
+def get_query_param(scope, name):
+    """Return a query string parameter of a WebSocket scope, or None"""
+    query = parse_qs(scope.get("query_string", b"").decode())
+    return query.get(name, [None])[0]
+
+
+def get_scope_token(scope):
+    """Return the `token` query string parameter of a WebSocket scope"""
+    return get_query_param(scope, "token")
+
+
+async def authenticate_token(token):
+    """Verify a JWT once and return its UserPrincipal, or None"""
+    if not token:
+        return None
 
-@database_sync_to_async
-def get_user(user_id):
     try:
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return AnonymousUser()
+        decoded_data = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    except InvalidTokenError as e:
+        logger.info(f"Token authentication error: {e}")
+        return None
+
+    user_id = decoded_data.get("user_id")
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        principal = await get_user(user_id)
+        if principal is not None:
+            principal_cache.set(principal)
+    return principal
+
 
 class JWTAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
-        query_string = scope.get("query_string", b"").decode()
-        token = None
-
-        if "token=" in query_string:
-            token = query_string.split("token=")[-1]
-
-        if token:
-            try:
-                decoded_data = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-                user_id = decoded_data.get("user_id")
-                scope["user"] = await get_user(user_id)
-            except (ExpiredSignatureError, InvalidTokenError, Exception):
-                scope["user"] = AnonymousUser()
-        else:
-            scope["user"] = AnonymousUser()
-
+        scope["user"] = await authenticate_token(get_scope_token(scope)) or AnonymousUser()
         return await super().__call__(scope, receive, send)
@@ -0,0 +1,120 @@
+# outbound.py
+import asyncio
+import logging
+from collections import deque
+from . import metrics
+from .codecs import encode_batch
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundBuffer:
+    """Bounded per-connection send queue drained by a single writer task.
+
+    Group handlers only append here, so a slow socket no longer stalls the
+    consumer's channel-layer reads. Once `high_water` frames are waiting,
+    `policy` decides what gives: 'drop_ephemeral' sheds queued presence
+    frames first and only then asks for the connection to be closed,
+    'close' asks for it straight away.
+
+    With a `batch_window` the writer waits that many seconds after the
+    first queued frame and sends up to `batch_max` queued frames as one
+    `batch` frame, in queue order.
+
+    Only frames not yet handed to `send` are counted. That bounds a slow
+    socket only when the server's send() waits for the socket, as
+    uvicorn's websocket implementations do once their write buffer fills.
+    Daphne's send() returns as soon as the frame is queued on the Twisted
+    transport, with no backpressure. Under Daphne this catches a stalled
+    consumer loop, while frames for a slow client pile up in the
+    transport's write buffer, out of reach of the policy.
+    """
+
+    def __init__(self, send, high_water, policy='drop_ephemeral', batch_window=0, batch_max=1):
+        self.send = send
+        self.high_water = high_water
+        self.policy = policy
+        self.batch_window = batch_window
+        self.batch_max = max(1, batch_max)
+        self.frames = deque()
+        self.ready = asyncio.Event()
+        self.task = None
+        self.slow = False
+        self.closed = False
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    def put(self, frame, ephemeral=False):
+        """Queue send kwargs; False when the buffer overflowed and the socket must be closed"""
+        if self.closed:
+            return True
+        if len(self.frames) >= self.high_water:
+            self.mark_slow()
+            if self.policy == 'drop_ephemeral':
+                if ephemeral:
+                    metrics.increment('chat_outbound_dropped_total', reason='ephemeral')
+                    return True
+                self.drop_ephemeral()
+            if len(self.frames) >= self.high_water:
+                return False
+        self.frames.append((frame, ephemeral))
+        metrics.adjust_gauge('chat_outbound_queued_frames', 1)
+        self.ready.set()
+        return True
+
+    def drop_ephemeral(self):
+        kept = deque(item for item in self.frames if not item[1])
+        dropped = len(self.frames) - len(kept)
+        if dropped:
+            metrics.increment('chat_outbound_dropped_total', dropped, reason='ephemeral')
+            metrics.adjust_gauge('chat_outbound_queued_frames', -dropped)
+        self.frames = kept
+
+    def mark_slow(self):
+        if not self.slow:
+            self.slow = True
+            metrics.increment('chat_slow_consumers_total')
+            metrics.adjust_gauge('chat_slow_consumers', 1)
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            if self.batch_window and len(self.frames) < self.batch_max:
+                await asyncio.sleep(self.batch_window)
+            while self.frames:
+                count = min(self.batch_max, len(self.frames))
+                frame = self.coalesce([self.frames.popleft()[0] for _ in range(count)])
+                metrics.adjust_gauge('chat_outbound_queued_frames', -count)
+                try:
+                    await self.send(**frame)
+                except Exception as e:
+                    logger.info(f"Outbound send failed: {e}")
+            self.ready.clear()
+            # Caught up again, so this connection no longer counts as slow
+            if self.slow:
+                self.slow = False
+                metrics.adjust_gauge('chat_slow_consumers', -1)
+
+    def coalesce(self, frames):
+        if len(frames) == 1:
+            return frames[0]
+        metrics.increment('chat_outbound_batches_total')
+        metrics.increment('chat_outbound_batched_frames_total', len(frames))
+        if 'bytes_data' in frames[0]:
+            return {'bytes_data': encode_batch([frame['bytes_data'] for frame in frames], binary=True)}
+        return {'text_data': encode_batch([frame['text_data'] for frame in frames])}
+
+    def close(self):
+        """Stop the writer and discard anything still queued"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.frames:
+            metrics.adjust_gauge('chat_outbound_queued_frames', -len(self.frames))
+        self.frames.clear()
+        if self.task:
+            self.task.cancel()
+        if self.slow:
+            self.slow = False
+            metrics.adjust_gauge('chat_slow_consumers', -1)
@@ -0,0 +1,174 @@
+# presence.py
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .codecs import encode_broadcast
+
+logger = logging.getLogger(__name__)
+
+
+class LocalPresenceStore:
+    """In-process connection counts per room and user"""
+
+    def __init__(self):
+        self.rooms = {}
+
+    async def add(self, room_id, user_id):
+        """Count a connection; True when it is the user's first in the room"""
+        members = self.rooms.setdefault(room_id, Counter())
+        members[user_id] += 1
+        return members[user_id] == 1
+
+    async def remove(self, room_id, user_id):
+        """Uncount a connection; True when it was the user's last in the room"""
+        members = self.rooms.get(room_id)
+        if not members or members[user_id] <= 0:
+            return False
+        members[user_id] -= 1
+        if members[user_id] > 0:
+            return False
+        del members[user_id]
+        if not members:
+            del self.rooms[room_id]
+        return True
+
+    async def members(self, room_id):
+        return list(self.rooms.get(room_id, ()))
+
+    async def clear(self):
+        self.rooms.clear()
+
+
+class RedisPresenceStore:
+    """Connection counts in a Redis hash per room, shared by all workers"""
+
+    def __init__(self, url, ttl):
+        import redis.asyncio as redis
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def key(self, room_id):
+        return f'chat:presence:{room_id}'
+
+    async def add(self, room_id, user_id):
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hincrby(self.key(room_id), user_id, 1)
+            # Bounds stale counts left behind by a crashed worker
+            pipe.expire(self.key(room_id), self.ttl)
+            count, _ = await pipe.execute()
+            return count == 1
+        except Exception as e:
+            logger.info(f"Presence add failed: {e}")
+            return True
+
+    async def remove(self, room_id, user_id):
+        try:
+            count = await self.redis.hincrby(self.key(room_id), user_id, -1)
+            if count <= 0:
+                await self.redis.hdel(self.key(room_id), user_id)
+            return count <= 0
+        except Exception as e:
+            logger.info(f"Presence remove failed: {e}")
+            return True
+
+    async def members(self, room_id):
+        try:
+            return [int(user_id) for user_id in await self.redis.hkeys(self.key(room_id))]
+        except Exception as e:
+            logger.info(f"Presence read failed: {e}")
+            return []
+
+    async def clear(self):
+        async for key in self.redis.scan_iter(match='chat:presence:*'):
+            await self.redis.delete(key)
+
+
+class RoomPresence:
+    """Tracks room members and coalesces join/leave changes.
+
+    Changes are collected per room for `window` seconds and then fanned out
+    as a single `presence_delta` group event, so N simultaneous reconnects
+    cost one event per worker per window instead of N.
+    """
+
+    def __init__(self, store, window):
+        self.store = store
+        self.window = window
+        self.pending = {}
+        self.flushers = {}
+
+    async def join(self, room_id, user_id, user_name):
+        if await self.store.add(room_id, user_id):
+            self.queue(room_id, 'joined', 'left', user_id, user_name)
+
+    async def leave(self, room_id, user_id, user_name):
+        if await self.store.remove(room_id, user_id):
+            self.queue(room_id, 'left', 'joined', user_id, user_name)
+
+    async def members(self, room_id):
+        return await self.store.members(room_id)
+
+    def queue(self, room_id, change, opposite, user_id, user_name):
+        pending = self.pending.setdefault(room_id, {'joined': {}, 'left': {}})
+        # A join and a leave inside one window cancel out
+        if pending[opposite].pop(user_id, None) is None:
+            pending[change][user_id] = user_name
+
+        flusher = self.flushers.get(room_id)
+        if flusher is None or flusher.done():
+            self.flushers[room_id] = asyncio.ensure_future(self.flush_later(room_id))
+
+    async def flush_later(self, room_id):
+        await asyncio.sleep(self.window)
+        await self.flush(room_id)
+
+    async def flush(self, room_id):
+        pending = self.pending.pop(room_id, None)
+        self.flushers.pop(room_id, None)
+        if not pending or not (pending['joined'] or pending['left']):
+            return
+
+        frame = {
+            'type': 'presence_delta',
+            'joined': [{'user_id': uid, 'user_name': name} for uid, name in pending['joined'].items()],
+            'left': [{'user_id': uid, 'user_name': name} for uid, name in pending['left'].items()],
+            'timestamp': datetime.now().isoformat()
+        }
+        try:
+            await get_channel_layer().group_send(f'chat_{room_id}', {
+                'type': 'presence_delta',
+                'user_ids': list(pending['joined']) + list(pending['left']),
+                **encode_broadcast(frame)
+            })
+        except Exception as e:
+            logger.info(f"Presence fan-out failed: {e}")
+
+    async def clear(self):
+        for flusher in self.flushers.values():
+            flusher.cancel()
+        self.flushers.clear()
+        self.pending.clear()
+        await self.store.clear()
+
+
+@lru_cache(maxsize=None)
+def load_presence(backend, window_ms, url, ttl):
+    store = RedisPresenceStore(url, ttl) if backend == 'redis' else LocalPresenceStore()
+    return RoomPresence(store, window_ms / 1000)
+
+
+def get_presence():
+    """Room presence tracker, or None when CHAT_PRESENCE_WINDOW_MS is 0 (per-connection join/leave)"""
+    if not settings.CHAT_PRESENCE_WINDOW_MS:
+        return None
+    return load_presence(
+        settings.CHAT_PRESENCE_BACKEND,
+        settings.CHAT_PRESENCE_WINDOW_MS,
+        settings.CHAT_PRESENCE_URL,
+        settings.CHAT_PRESENCE_TTL,
+    )
@@ -0,0 +1,98 @@
+# query_budget.py
+import functools
+import inspect
+import logging
+from contextvars import ContextVar
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Innermost active budget; sync_to_async copies the context, so ORM calls
+# made on executor threads are charged to the handler that awaited them
+current_budget = ContextVar('query_budget', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised, in strict mode, when a block runs more queries than it is allowed"""
+
+
+class QueryBudget:
+    """Counts the SQL statements run while it is active, on any thread.
+
+    On exit, going over `limit` increments query_budget_exceeded_total and
+    logs a warning; with QUERY_BUDGET_STRICT (the default under
+    `manage.py test`) it raises QueryBudgetExceeded instead, so an N+1
+    fails the test suite rather than slowing production down. Usable as a
+    sync or async context manager, or through the query_budget decorator.
+    """
+
+    def __init__(self, limit, name='block'):
+        self.limit = limit
+        self.name = name
+        self.queries = []
+        self.parent = None
+        self.token = None
+
+    def record(self, sql):
+        self.queries.append(sql)
+        # Nested budgets: the enclosing block pays for these queries too
+        if self.parent is not None:
+            self.parent.record(sql)
+
+    def __enter__(self):
+        self.parent = current_budget.get()
+        self.token = current_budget.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current_budget.reset(self.token)
+        if exc_type is None:
+            self.check()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.__exit__(exc_type, exc, tb)
+
+    def check(self):
+        if len(self.queries) <= self.limit:
+            return
+        metrics.increment('query_budget_exceeded_total', name=self.name)
+        message = f"{self.name} ran {len(self.queries)} queries, budget is {self.limit}"
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message + ":\n" + "\n".join(self.queries))
+        logger.warning(message)
+
+
+def query_budget(limit, name=None):
+    """Decorator: run a view method or async consumer handler inside a QueryBudget"""
+    def decorator(func):
+        budget_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                async with QueryBudget(limit, budget_name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with QueryBudget(limit, budget_name):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_query(execute, sql, params, many, context):
+    """Database execute wrapper charging each statement to the active budget"""
+    budget = current_budget.get()
+    if budget is not None:
+        budget.record(sql)
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created receiver: put count_query on every new DB connection"""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
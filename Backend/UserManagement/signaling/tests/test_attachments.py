@@ -0,0 +1,49 @@
+import base64
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from signaling import attachments
+from signaling.attachments import AttachmentBudget, AttachmentTooLarge, decoded_length, open_inline_file
+
+
+class InlineAttachmentTests(SimpleTestCase):
+    """Test suite for chunked decoding of inline chat media"""
+
+    def data_url(self, content):
+        return 'data:application/octet-stream;base64,' + base64.b64encode(content).decode()
+
+    def test_decoded_length_matches_content(self):
+        for content in (b'', b'a', b'ab', b'abc', b'abcd' * 100):
+            with self.subTest(size=len(content)):
+                self.assertEqual(decoded_length(base64.b64encode(content).decode()), len(content))
+                url = self.data_url(content)
+                self.assertEqual(decoded_length(url, url.index(',') + 1), len(content))
+
+    def test_decodes_across_chunks(self):
+        content = bytes(range(256)) * 1000
+        # Small chunks and spool size so both the chunk loop and the disk spill run
+        with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024), \
+                mock.patch.object(attachments, 'CHUNK_CHARS', 4096):
+            content_file, size = open_inline_file('blob.bin', self.data_url(content), AttachmentBudget(10 ** 9, 10 ** 9))
+        with content_file:
+            self.assertEqual(size, len(content))
+            self.assertEqual(content_file.read(), content)
+
+    def test_rejects_data_url_without_base64(self):
+        with self.assertRaises(ValueError):
+            open_inline_file('note.txt', 'data:text/plain,hello', AttachmentBudget(100, 100))
+
+    def test_raw_bytes_pass_through(self):
+        content_file, size = open_inline_file('raw.bin', b'raw bytes', AttachmentBudget(100, 100))
+        self.assertEqual((content_file.read(), size), (b'raw bytes', 9))
+
+    def test_per_file_limit_rejects_before_decoding(self):
+        with self.assertRaises(AttachmentTooLarge) as raised:
+            open_inline_file('big.bin', self.data_url(b'x' * 101), AttachmentBudget(100, 1000))
+        self.assertEqual((raised.exception.name, raised.exception.limit), ('big.bin', 100))
+
+    def test_per_message_limit_spans_files(self):
+        budget = AttachmentBudget(per_file=100, per_message=150)
+        open_inline_file('first.bin', self.data_url(b'x' * 100), budget)
+        with self.assertRaises(AttachmentTooLarge) as raised:
+            open_inline_file('second.bin', self.data_url(b'x' * 60), budget)
+        self.assertEqual(raised.exception.limit, 50)
@@ -0,0 +1,69 @@
+from datetime import time
+from decimal import Decimal
+from io import BytesIO
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import ParseError
+from signaling.codecs import (
+    CODECS, DecodeError, StdlibJSONCodec, encode_batch, get_codec, get_msgpack_codec, load_codec
+)
+from User.parsers import CodecJSONParser
+from User.renderers import CodecJSONRenderer
+
+
+class CodecTests(SimpleTestCase):
+    """Test suite for the pluggable JSON codecs"""
+
+    def available_codecs(self):
+        for name in CODECS:
+            try:
+                yield CODECS[name]()
+            except ImportError:
+                continue
+
+    def test_round_trip(self):
+        payload = {'type': 'chat_message', 'message': 'héllo  ', 'media': [], 'id': 1}
+        for codec in self.available_codecs():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.loads(codec.dumps(payload)), payload)
+                self.assertEqual(codec.loads(codec.dumpb(payload)), payload)
+
+    def test_invalid_json_raises_decode_error(self):
+        for codec in self.available_codecs():
+            with self.subTest(codec=codec.name):
+                with self.assertRaises(DecodeError):
+                    codec.loads('{invalid json}')
+
+    def test_unknown_codec_falls_back_to_stdlib(self):
+        self.assertIsInstance(load_codec('does-not-exist'), StdlibJSONCodec)
+
+    @override_settings(JSON_CODEC='stdlib')
+    def test_setting_selects_codec(self):
+        self.assertEqual(get_codec().name, 'stdlib')
+
+    def test_encode_batch_wraps_encoded_frames(self):
+        events = [{'type': 'chat_message', 'id': 1}, {'type': 'presence_delta', 'joined': []}]
+        text = encode_batch([get_codec().dumps(event) for event in events])
+        self.assertEqual(get_codec().loads(text), {'type': 'batch', 'events': events})
+
+        msgpack_codec = get_msgpack_codec()
+        blob = encode_batch([msgpack_codec.dumpb(event) for event in events], binary=True)
+        self.assertEqual(msgpack_codec.loads(blob), {'type': 'batch', 'events': events})
+
+
+class CodecDRFTests(SimpleTestCase):
+    """Test suite for the DRF renderer and parser built on the codecs"""
+
+    def test_renderer_handles_drf_types(self):
+        for name in CODECS:
+            with self.subTest(codec=name), override_settings(JSON_CODEC=name):
+                try:
+                    CODECS[name]()
+                except ImportError:
+                    # Reported as skipped rather than silently run on the stdlib fallback
+                    self.skipTest(f"{name} is not installed")
+                rendered = CodecJSONRenderer().render({'price': Decimal('1.50'), 'ts': time(10, 30)})
+                self.assertEqual(get_codec().loads(rendered), {'price': 1.5, 'ts': '10:30:00'})
+
+    def test_parser_rejects_invalid_json(self):
+        with self.assertRaises(ParseError):
+            CodecJSONParser().parse(BytesIO(b'{invalid json}'))
@@ -1,13 +1,23 @@
 import base64
 import asyncio
+from unittest import mock
 from datetime import datetime, timedelta
-from django.test import TestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.contrib.auth import get_user_model
 from channels.testing import WebsocketCommunicator
+from channels.layers import get_channel_layer
 from channels.db import database_sync_to_async
-from User.models import Message, Room  
+from django.core.files.base import ContentFile
+from User.models import Message, Room, Attachment
 from signaling.consumers import ChatConsumer
+from signaling.history_cache import get_history_cache
+from signaling.outbound import OutboundBuffer
+from signaling.presence import get_presence
+from signaling.throttling import rate_limiter
+from signaling.write_behind import LocalSeqAllocator, get_message_writer, persist_messages
+from signaling import metrics
 import jwt
+import msgpack
 from django.conf import settings
 
 User = get_user_model()
@@ -60,6 +70,31 @@ def create_message(room, sender, message, sender_type='user'):
     )
 
 
+@database_sync_to_async
+def create_upload(room, user, content, name='upload.txt'):
+    """Create an out-of-band uploaded attachment asynchronously"""
+    return Attachment.objects.create(
+        room=room,
+        uploaded_by=user,
+        file=ContentFile(content, name=name),
+        file_type='text/plain',
+        original_filename=name,
+        file_size=len(content)
+    )
+
+
+@database_sync_to_async
+def get_room(room_id):
+    """Reload a room asynchronously"""
+    return Room.objects.get(id=room_id)
+
+
+@database_sync_to_async
+def get_attachment_count():
+    """Get attachment count asynchronously"""
+    return Attachment.objects.count()
+
+
 @database_sync_to_async
 def get_message_count():
     """Get message count asynchronously"""
@@ -95,7 +130,12 @@ def delete_all_rooms():
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': ':memory:',
         }
-    }
+    },
+    CHAT_HISTORY_CACHE_BACKEND='local',
+    CHAT_PRESENCE_BACKEND='local',
+    # Keep DB calls on the thread that owns the test transaction
+    CHAT_DB_READ_WORKERS=0,
+    CHAT_DB_WRITE_WORKERS=0
 )
 class ChatConsumerTests(TestCase):
     """Test suite for ChatConsumer WebSocket consumer"""
@@ -103,6 +143,10 @@ class ChatConsumerTests(TestCase):
     async def async_setup(self):
         """Async setup method - runs before each test"""
         # Clean up any existing data first
+        await get_history_cache().clear()
+        await get_presence().clear()
+        rate_limiter.clear()
+        metrics.reset()
         await delete_all_messages()
         await delete_all_users()
         await delete_all_rooms()
@@ -159,12 +203,13 @@ class ChatConsumerTests(TestCase):
         token = jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
         return token
 
-    def _create_communicator(self, token=None):
+    def _create_communicator(self, token=None, subprotocols=None):
         """Helper to create properly configured WebsocketCommunicator"""
         communicator = WebsocketCommunicator(
             ChatConsumer.as_asgi(),
             f'/ws/chat/{self.room_id}/',
             headers=[(b'origin', b'http://localhost')],
+            subprotocols=subprotocols,
         )
         if token:
             communicator.scope['query_string'] = f'token={token}'.encode()
@@ -272,6 +317,15 @@ class ChatConsumerTests(TestCase):
         self.assertEqual(response['type'], 'chat_message')
         self.assertEqual(response['message'], 'Test message')
         self.assertEqual(response['sender_id'], self.user.id)
+        self.assertEqual(response['seq'], 1)
+
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['chat_db_execution_seconds_count{method="save_message",pool="write"}'], 1)
+        self.assertEqual(counters['chat_db_queue_wait_seconds_count{method="save_message",pool="write"}'], 1)
+        self.assertEqual(metrics.snapshot()['gauges']['chat_db_in_flight{method="save_message",pool="write"}'], 0)
+        # Hot reads use the async ORM, timed under the 'async' pool label
+        for method in ('get_messages', 'get_total_messages'):
+            self.assertGreaterEqual(counters[f'chat_db_execution_seconds_count{{method="{method}",pool="async"}}'], 1)
 
         await communicator.disconnect()
 
@@ -308,6 +362,229 @@ class ChatConsumerTests(TestCase):
 
         await communicator.disconnect()
 
+    @async_to_sync_test
+    async def test_attachment_failure_rolls_back_message(self):
+        """Test that a failed attachment insert leaves no message and no stored file"""
+        communicator = self._create_communicator(self.valid_token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history
+
+        file_base64 = base64.b64encode(b'file content').decode()
+        media = [
+            {'data': f'data:text/plain;base64,{file_base64}', 'name': f'file{i}.txt', 'type': 'text/plain'}
+            for i in range(3)
+        ]
+        with mock.patch.object(Attachment.objects, 'bulk_create', side_effect=RuntimeError('insert failed')), \
+                mock.patch('django.db.models.fields.files.FieldFile.delete') as delete_file:
+            await communicator.send_json_to({'type': 'message', 'message': 'Files', 'media': media})
+            response = await communicator.receive_json_from()
+
+        self.assertEqual(response['type'], 'error')
+        self.assertEqual(await get_message_count(), 0)
+        self.assertEqual(await get_attachment_count(), 0)
+        self.assertEqual(delete_file.call_count, 3)
+
+        await communicator.disconnect()
+
+    @override_settings(CHAT_ATTACHMENT_MAX_SIZE=10)
+    @async_to_sync_test
+    async def test_oversized_attachment_rejected(self):
+        """Test that inline media over the size limit rejects the whole message"""
+        communicator = self._create_communicator(self.valid_token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history
+
+        file_base64 = base64.b64encode(b'more than ten bytes').decode()
+        await communicator.send_json_to({
+            'type': 'message',
+            'message': 'Too big',
+            'media': [{'data': f'data:text/plain;base64,{file_base64}', 'name': 'big.txt', 'type': 'text/plain'}]
+        })
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'error')
+        self.assertEqual(response['code'], 'attachment_too_large')
+        self.assertEqual(response['name'], 'big.txt')
+        self.assertEqual(await get_message_count(), 0)
+
+        await communicator.disconnect()
+
+    @async_to_sync_test
+    async def test_send_message_with_uploaded_attachment(self):
+        """Test sending message that references an attachment uploaded over HTTP"""
+        upload = await create_upload(self.room, self.user, b'uploaded content')
+
+        communicator = self._create_communicator(self.valid_token)
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history
+
+        await communicator.send_json_to({
+            'type': 'message',
+            'message': 'See upload',
+            'media': [{'id': upload.id}]
+        })
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'chat_message')
+        self.assertEqual(len(response['media']), 1)
+        self.assertEqual(response['media'][0]['id'], upload.id)
+        self.assertEqual(response['media'][0]['name'], 'upload.txt')
+
+        await communicator.disconnect()
+
+    @async_to_sync_test
+    async def test_legacy_broadcast_event_still_delivered(self):
+        """Test that dict-only broadcast events from older workers are still encoded"""
+        communicator = self._create_communicator(self.valid_token)
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history
+
+        await get_channel_layer().group_send(f'chat_{self.room_id}', {
+            'type': 'chat_message_broadcast',
+            'message': {
+                'id': 1,
+                'message': 'From old worker',
+                'sender_id': self.user2.id,
+                'sender_name': 'Test User 2',
+                'created_at': datetime.now().isoformat(),
+            }
+        })
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'chat_message')
+        self.assertEqual(response['message'], 'From old worker')
+        self.assertEqual(response['media'], [])
+
+        await communicator.disconnect()
+
+    @async_to_sync_test
+    async def test_msgpack_subprotocol(self):
+        """Test binary MessagePack frames with raw attachment bytes"""
+        communicator = self._create_communicator(self.valid_token, subprotocols=['chat.msgpack.v1'])
+
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'chat.msgpack.v1')
+
+        response = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(response['type'], 'connection_established')
+        await communicator.receive_from()  # message_history
+
+        await communicator.send_to(bytes_data=msgpack.packb({
+            'type': 'message',
+            'message': 'Binary file',
+            'media': [{'data': b'raw bytes', 'name': 'raw.bin', 'type': 'application/octet-stream'}]
+        }, use_bin_type=True))
+
+        response = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(response['type'], 'chat_message')
+        self.assertEqual(response['media'][0]['size'], len(b'raw bytes'))
+
+        await communicator.disconnect()
+
+    @override_settings(CHAT_BATCH_WINDOW_MS=50)
+    @async_to_sync_test
+    async def test_batched_frames(self):
+        """Test that ?batch=1 clients get queued frames coalesced in order"""
+        communicator = self._create_communicator(self.valid_token)
+        communicator.scope['query_string'] += b'&batch=1'
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        response = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(response['type'], 'batch')
+        self.assertEqual(
+            [event['type'] for event in response['events']],
+            ['connection_established', 'message_history']
+        )
+
+        for text in ('one', 'two', 'three'):
+            await communicator.send_json_to({'type': 'message', 'message': text})
+
+        received = []
+        while len(received) < 3:
+            response = await communicator.receive_json_from(timeout=2)
+            received.extend(response['events'] if response['type'] == 'batch' else [response])
+        self.assertEqual([event['message'] for event in received], ['one', 'two', 'three'])
+
+        await communicator.disconnect()
+
+    @override_settings(
+        CHAT_WRITE_BEHIND_ENABLED=True,
+        CHAT_WRITE_BEHIND_BACKEND='local',
+        CHAT_WRITE_BEHIND_INTERVAL_MS=60000
+    )
+    @async_to_sync_test
+    async def test_write_behind_broadcasts_before_persisting(self):
+        """Test that write-behind messages are broadcast first and bulk-written on flush"""
+        writer = get_message_writer()
+        await writer.clear()
+        upload = await create_upload(self.room, self.user, b'uploaded bytes')
+
+        communicator = self._create_communicator(self.valid_token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history
+
+        await communicator.send_json_to({'type': 'message', 'message': 'First'})
+        await communicator.send_json_to({'type': 'message', 'message': 'Second', 'media': [{'id': upload.id}]})
+
+        first = await communicator.receive_json_from()
+        second = await communicator.receive_json_from()
+        self.assertEqual((first['seq'], second['seq']), (1, 2))
+        self.assertIsNone(first['id'])
+        self.assertEqual(second['media'][0]['id'], upload.id)
+        self.assertEqual(await get_message_count(), 0)
+
+        self.assertEqual(len(first['write_id']), 32)
+
+        batch = list(writer.pending)
+        await writer.flush()
+        self.assertEqual(await get_message_count(), 2)
+
+        # The flush names each broadcast message's row, keyed on write_id
+        stored = await communicator.receive_json_from()
+        self.assertEqual(stored['type'], 'messages_stored')
+        ids = await database_sync_to_async(lambda: list(Message.objects.order_by('seq').values_list('id', flat=True)))()
+        self.assertEqual(
+            [(item['write_id'], item['id'], item['seq']) for item in stored['messages']],
+            [(first['write_id'], ids[0], 1), (second['write_id'], ids[1], 2)],
+        )
+        cached = await get_history_cache().get_recent(self.room_id, 10)
+        self.assertEqual([msg['id'] for msg in cached], ids)
+        room = await get_room(self.room_id)
+        self.assertEqual((room.message_count, room.last_seq), (2, 2))
+
+        message = await database_sync_to_async(Message.objects.get)(seq=2)
+        self.assertEqual(await database_sync_to_async(lambda: message.attachments.get().id)(), upload.id)
+
+        # Replaying an already written batch (e.g. from the journal) is a no-op
+        self.assertEqual(await database_sync_to_async(persist_messages)(batch), (0, set()))
+
+        # A different message on a taken seq is kept under a new one, not dropped
+        collision = {**batch[0], 'write_id': '0' * 32, 'message': 'Collided'}
+        inserted, collided = await database_sync_to_async(persist_messages)([collision])
+        self.assertEqual((inserted, collided), (1, {self.room_id}))
+        message = await database_sync_to_async(Message.objects.get)(message='Collided')
+        self.assertEqual(message.seq, 3)
+        self.assertEqual(metrics.snapshot()['counters']['chat_write_behind_seq_collisions_total'], 1)
+
+        await communicator.disconnect()
+
     @async_to_sync_test
     async def test_empty_message_not_sent(self):
         """Test that empty messages are not saved"""
@@ -370,6 +647,174 @@ class ChatConsumerTests(TestCase):
 
         await communicator.disconnect()
 
+    @async_to_sync_test
+    async def test_fetch_messages_cursor_pagination(self):
+        """Test keyset pagination with before_id cursor"""
+        created = []
+        for i in range(5):
+            created.append(await create_message(
+                room=self.room,
+                sender=self.user,
+                message=f'Message {i}',
+                sender_type='user'
+            ))
+
+        communicator = self._create_communicator(self.valid_token)
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history
+
+        await communicator.send_json_to({
+            'type': 'fetch_messages',
+            'limit': 2,
+            'before_id': created[-1].id
+        })
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'message_history')
+        self.assertEqual([m['message'] for m in response['messages']], ['Message 2', 'Message 3'])
+        self.assertTrue(response['has_more'])
+        self.assertEqual(response['next_cursor']['before_id'], created[2].id)
+
+        await communicator.send_json_to({
+            'type': 'fetch_messages',
+            'limit': 2,
+            **response['next_cursor']
+        })
+
+        response = await communicator.receive_json_from()
+        self.assertEqual([m['message'] for m in response['messages']], ['Message 0', 'Message 1'])
+        self.assertFalse(response['has_more'])
+
+        await communicator.disconnect()
+
+    @override_settings(CHAT_RESUME_MAX_GAP=3)
+    @async_to_sync_test
+    async def test_resume_since_id(self):
+        """Test that reconnecting with since_id only sends missed messages"""
+        created = [
+            await create_message(room=self.room, sender=self.user, message=f'Message {i}')
+            for i in range(6)
+        ]
+
+        communicator = self._create_communicator(self.valid_token)
+        communicator.scope['query_string'] += f'&since_id={created[3].id}'.encode()
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.receive_json_from()  # connection_established
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'message_history')
+        self.assertEqual(response['since_id'], created[3].id)
+        self.assertEqual([m['message'] for m in response['messages']], ['Message 4', 'Message 5'])
+
+        # Too far behind: resync_required followed by the newest page
+        await communicator.send_json_to({'type': 'resume', 'since_id': created[0].id})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'resync_required')
+        response = await communicator.receive_json_from()
+        self.assertEqual(len(response['messages']), 6)
+        self.assertNotIn('since_id', response)
+
+        await communicator.send_json_to({'type': 'resume', 'since_seq': created[4].seq})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['since_seq'], created[4].seq)
+        self.assertEqual([m['seq'] for m in response['messages']], [created[5].seq])
+
+        await communicator.disconnect()
+
+    @async_to_sync_test
+    async def test_resume_skips_history_cache_with_a_gap(self):
+        """Test that resume reads the DB when the cached seqs have a hole"""
+        created = [
+            await create_message(room=self.room, sender=self.user, message=f'Message {i}')
+            for i in range(4)
+        ]
+
+        communicator = self._create_communicator(self.valid_token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history, warms the cache
+
+        # What a lost append leaves behind: seq 3 missing from the warm cache
+        buffer = get_history_cache().rooms[self.room_id]
+        buffer[:] = [msg for msg in buffer if msg['seq'] != created[2].seq]
+
+        await communicator.send_json_to({'type': 'resume', 'since_seq': created[0].seq})
+        response = await communicator.receive_json_from()
+        self.assertEqual([m['message'] for m in response['messages']], ['Message 1', 'Message 2', 'Message 3'])
+
+        await communicator.disconnect()
+
+    @async_to_sync_test
+    async def test_search_pages_ranked_results(self):
+        """Test that the search event returns ranked matches a page at a time"""
+        await create_message(room=self.room, sender=self.user, message='deploy deploy deploy tonight')
+        await create_message(room=self.room, sender=self.user, message='lunch plans')
+        await create_message(room=self.room, sender=self.user, message='the deploy went fine')
+
+        communicator = self._create_communicator(self.valid_token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history
+
+        await communicator.send_json_to({'type': 'search', 'query': 'deployed', 'limit': 1})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'search_results')
+        self.assertEqual([m['message'] for m in response['messages']], ['deploy deploy deploy tonight'])
+        self.assertTrue(response['has_more'])
+
+        await communicator.send_json_to({
+            'type': 'search', 'query': 'deployed', 'limit': 1, 'cursor': response['next_cursor']
+        })
+        response = await communicator.receive_json_from()
+        self.assertEqual([m['message'] for m in response['messages']], ['the deploy went fine'])
+        self.assertIsNone(response['next_cursor'])
+
+        await communicator.send_json_to({'type': 'search', 'query': 'deploy', 'cursor': 'bogus'})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['code'], 'invalid_search')
+
+        await communicator.disconnect()
+
+    @async_to_sync_test
+    async def test_initial_history_served_from_cache(self):
+        """Test that the initial message_history comes from the warm history cache"""
+        await create_message(room=self.room, sender=self.user, message='Before warm-up')
+
+        communicator = self._create_communicator(self.valid_token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.receive_json_from()  # connection_established
+        response = await communicator.receive_json_from()
+        self.assertEqual([m['message'] for m in response['messages']], ['Before warm-up'])
+
+        await communicator.send_json_to({'type': 'message', 'message': 'Cached', 'media': []})
+        await communicator.receive_json_from()  # chat_message
+        await communicator.disconnect()
+
+        cached = await get_history_cache().get_recent(self.room_id, 50)
+        self.assertEqual([m['message'] for m in cached], ['Before warm-up', 'Cached'])
+
+        # Written behind the cache's back, so only visible to DB reads
+        await create_message(room=self.room, sender=self.user, message='Not cached')
+
+        communicator = self._create_communicator(self.valid_token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.receive_json_from()  # connection_established
+        response = await communicator.receive_json_from()
+        self.assertEqual([m['message'] for m in response['messages']], ['Before warm-up', 'Cached'])
+
+        await communicator.disconnect()
+
     @async_to_sync_test
     async def test_invalid_json(self):
         """Test handling of invalid JSON"""
@@ -429,6 +874,7 @@ class ChatConsumerTests(TestCase):
 
         await communicator.disconnect()
 
+    @override_settings(CHAT_PRESENCE_WINDOW_MS=0)
     @async_to_sync_test
     async def test_user_join_notification(self):
         """Test that user join notifications are sent to other users"""
@@ -455,4 +901,184 @@ class ChatConsumerTests(TestCase):
         self.assertEqual(response['user_id'], self.user2.id)
 
         await communicator1.disconnect()
-        await communicator2.disconnect()
\ No newline at end of file
+        await communicator2.disconnect()
+
+    @async_to_sync_test
+    async def test_presence_delta_notification(self):
+        """Test that joins and leaves of other users arrive as presence_delta"""
+        communicator1 = self._create_communicator(self.valid_token)
+        connected1, _ = await communicator1.connect()
+        self.assertTrue(connected1)
+
+        response = await communicator1.receive_json_from()  # connection_established
+        self.assertEqual(response['online_users'], [self.user.id])
+        await communicator1.receive_json_from()  # message_history
+
+        communicator2 = self._create_communicator(self._generate_jwt_token(self.user2))
+        connected2, _ = await communicator2.connect()
+        self.assertTrue(connected2)
+
+        await communicator2.receive_json_from()  # connection_established
+        await communicator2.receive_json_from()  # message_history
+
+        response = await communicator1.receive_json_from(timeout=2)
+        self.assertEqual(response['type'], 'presence_delta')
+        self.assertIn(self.user2.id, [member['user_id'] for member in response['joined']])
+
+        await communicator2.disconnect()
+        response = await communicator1.receive_json_from(timeout=2)
+        self.assertEqual(response['type'], 'presence_delta')
+        self.assertEqual(response['left'], [{'user_id': self.user2.id, 'user_name': 'Test User 2'}])
+
+        await communicator1.disconnect()
+
+    @async_to_sync_test
+    async def test_presence_changes_coalesced_per_window(self):
+        """Test that many joins in one window produce one group event"""
+        presence = get_presence()
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(f'chat_{self.room_id}', channel_name)
+
+        await presence.join(self.room_id, 1, 'One')
+        await presence.join(self.room_id, 2, 'Two')
+        await presence.join(self.room_id, 3, 'Three')
+        await presence.leave(self.room_id, 3, 'Three')  # cancels out
+        await presence.join(self.room_id, 2, 'Two')  # second tab, not a new join
+
+        event = await asyncio.wait_for(channel_layer.receive(channel_name), timeout=2)
+        self.assertEqual(event['type'], 'presence_delta')
+        self.assertEqual(event['user_ids'], [1, 2])
+        self.assertEqual(sorted(await presence.members(self.room_id)), [1, 2])
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(channel_layer.receive(channel_name), timeout=0.5)
+
+    @override_settings(CHAT_RATE_LIMITS={'message': {'user': (0.01, 2)}})
+    @async_to_sync_test
+    async def test_message_rate_limited(self):
+        """Test that frames over the per-user budget get a rate_limited error"""
+        communicator = self._create_communicator(self.valid_token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        await communicator.receive_json_from()  # message_history
+
+        for text in ('one', 'two', 'three'):
+            await communicator.send_json_to({'type': 'message', 'message': text})
+
+        responses = [await communicator.receive_json_from(timeout=2) for _ in range(3)]
+        self.assertEqual([r['type'] for r in responses].count('chat_message'), 2)
+        error = next(r for r in responses if r['type'] == 'error')
+        self.assertEqual(error['code'], 'rate_limited')
+        self.assertEqual(error['event'], 'message')
+        self.assertEqual(error['scope'], 'user')
+        self.assertGreater(error['retry_after'], 0)
+
+        self.assertEqual(await get_message_count(), 2)
+        self.assertEqual(
+            metrics.snapshot()['counters']['chat_throttled_events_total{event="message",scope="user"}'],
+            1
+        )
+
+        await communicator.disconnect()
+
+
+class LocalSeqAllocatorTests(SimpleTestCase):
+    """Test suite for the single-worker write-behind sequence allocator"""
+
+    @async_to_sync_test
+    async def test_concurrent_first_messages_get_distinct_seqs(self):
+        """Test that messages racing into a cold room are seeded once"""
+        async def slow_load(room_id):
+            await asyncio.sleep(0.01)
+            return 5
+
+        allocator = LocalSeqAllocator()
+        with mock.patch('signaling.write_behind.load_last_seq', side_effect=slow_load) as load:
+            seqs = await asyncio.gather(allocator.next(1), allocator.next(1), allocator.next(1))
+        self.assertEqual(sorted(seqs), [6, 7, 8])
+        self.assertEqual(load.call_count, 1)
+
+
+class OutboundBufferTests(SimpleTestCase):
+    """Test suite for the per-connection outbound buffer"""
+
+    def setUp(self):
+        metrics.reset()
+
+    @async_to_sync_test
+    async def test_overflow_drops_ephemeral_then_evicts(self):
+        """Test that presence frames are shed before the connection is evicted"""
+        sent = []
+        unblock = asyncio.Event()
+
+        async def slow_send(**frame):
+            await unblock.wait()
+            sent.append(frame['text_data'])
+
+        buffer = OutboundBuffer(slow_send, high_water=3)
+        buffer.start()
+        self.assertTrue(buffer.put({'text_data': 'chat-1'}))
+        await asyncio.sleep(0)  # writer takes chat-1 and blocks on the socket
+        self.assertTrue(buffer.put({'text_data': 'join'}, ephemeral=True))
+        self.assertTrue(buffer.put({'text_data': 'chat-2'}))
+        self.assertTrue(buffer.put({'text_data': 'chat-3'}))
+
+        # Full: a new presence frame is dropped, a chat frame evicts the queued one
+        self.assertTrue(buffer.put({'text_data': 'leave'}, ephemeral=True))
+        self.assertTrue(buffer.put({'text_data': 'chat-4'}))
+        self.assertFalse(buffer.put({'text_data': 'chat-5'}))
+        self.assertEqual(metrics.snapshot()['gauges']['chat_slow_consumers'], 1)
+        self.assertEqual(metrics.snapshot()['gauges']['chat_outbound_queued_frames'], 3)
+
+        unblock.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        self.assertEqual(sent, ['chat-1', 'chat-2', 'chat-3', 'chat-4'])
+
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['chat_outbound_dropped_total{reason="ephemeral"}'], 2)
+        self.assertEqual(counters['chat_slow_consumers_total'], 1)
+        self.assertEqual(metrics.snapshot()['gauges']['chat_slow_consumers'], 0)
+        self.assertEqual(metrics.snapshot()['gauges']['chat_outbound_queued_frames'], 0)
+        buffer.close()
+
+    @async_to_sync_test
+    async def test_non_blocking_send_never_overflows(self):
+        """Test that a send() that returns at once, as Daphne's does, never counts as slow"""
+        sent = []
+
+        async def transport_send(**frame):
+            # Queued on the transport and returned, however slow the client really is
+            sent.append(frame['text_data'])
+
+        buffer = OutboundBuffer(transport_send, high_water=2)
+        buffer.start()
+        for index in range(10):
+            self.assertTrue(buffer.put({'text_data': f'chat-{index}'}))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        self.assertEqual(len(sent), 10)
+        self.assertEqual(metrics.snapshot()['gauges'].get('chat_slow_consumers', 0), 0)
+        self.assertNotIn('chat_slow_consumers_total', metrics.snapshot()['counters'])
+        buffer.close()
+
+    @async_to_sync_test
+    async def test_close_policy_evicts_immediately(self):
+        """Test that the close policy never drops frames to make room"""
+        async def stalled_send(**frame):
+            await asyncio.Event().wait()
+
+        buffer = OutboundBuffer(stalled_send, high_water=1, policy='close')
+        buffer.start()
+        self.assertTrue(buffer.put({'text_data': 'chat-1'}))
+        await asyncio.sleep(0)
+        self.assertTrue(buffer.put({'text_data': 'join'}, ephemeral=True))
+        self.assertFalse(buffer.put({'text_data': 'leave'}, ephemeral=True))
+
+        buffer.close()
+        self.assertTrue(buffer.put({'text_data': 'chat-2'}))  # closed buffers just discard
+        self.assertEqual(metrics.snapshot()['gauges']['chat_slow_consumers'], 0)
+        self.assertEqual(metrics.snapshot()['gauges']['chat_outbound_queued_frames'], 0)
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+from unittest import mock
+from django.test import SimpleTestCase
+from signaling import metrics
+from signaling.executor import DBExecutor, db_connections
+
+
+class DBExecutorTests(SimpleTestCase):
+    """Test suite for the instrumented consumer DB executor"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_runs_on_named_pool_and_records_metrics(self):
+        executor = DBExecutor('write', max_workers=1)
+
+        def work(value):
+            return threading.current_thread().name, value * 2
+
+        thread_name, result = asyncio.run(executor.run('work', work, 21))
+        self.assertTrue(thread_name.startswith('chat-db-write'))
+        self.assertEqual(result, 42)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters']['chat_db_execution_seconds_count{method="work",pool="write"}'], 1)
+        self.assertEqual(snapshot['counters']['chat_db_queue_wait_seconds_count{method="work",pool="write"}'], 1)
+        self.assertEqual(snapshot['gauges']['chat_db_in_flight{method="work",pool="write"}'], 0)
+
+    def test_queue_wait_grows_when_pool_is_busy(self):
+        executor = DBExecutor('read', max_workers=1)
+        release = threading.Event()
+
+        async def main():
+            blocked = asyncio.ensure_future(executor.run('slow', release.wait))
+            queued = asyncio.ensure_future(executor.run('fast', lambda: None))
+            await asyncio.sleep(0.1)
+            self.assertEqual(metrics.snapshot()['gauges']['chat_db_in_flight{method="fast",pool="read"}'], 1)
+            release.set()
+            await asyncio.gather(blocked, queued)
+
+        asyncio.run(main())
+        waited = metrics.snapshot()['counters']['chat_db_queue_wait_seconds_sum{method="fast",pool="read"}']
+        self.assertGreaterEqual(waited, 0.1)
+
+
+class DBConnectionsTests(SimpleTestCase):
+    """Test suite for connection cleanup around async ORM handlers"""
+
+    def test_cleans_up_before_and_after_even_on_error(self):
+        @db_connections
+        async def handler():
+            self.assertEqual(cleanup.await_count, 1)
+            raise ValueError
+
+        with mock.patch('signaling.executor.aclose_old_connections', new_callable=mock.AsyncMock) as cleanup:
+            with self.assertRaises(ValueError):
+                asyncio.run(handler())
+        self.assertEqual(cleanup.await_count, 2)
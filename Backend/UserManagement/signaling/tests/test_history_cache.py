@@ -0,0 +1,59 @@
+import asyncio
+from django.test import SimpleTestCase
+from signaling.history_cache import LocalHistoryCache
+
+
+class LocalHistoryCacheTests(SimpleTestCase):
+    """Test suite for the in-process recent-history cache"""
+
+    def test_append_during_fill_invalidates_it(self):
+        async def main():
+            cache = LocalHistoryCache(size=10, max_rooms=10)
+            generation = await cache.generation(1)
+            # Saved and appended while the filler was reading the DB
+            await cache.append(1, {'seq': 3})
+            await cache.fill(1, [{'seq': 1}, {'seq': 2}], generation)
+            self.assertIsNone(await cache.get_recent(1, 10))
+
+            await cache.fill(1, [{'seq': 1}, {'seq': 2}, {'seq': 3}], await cache.generation(1))
+            return await cache.get_recent(1, 10)
+
+        self.assertEqual([msg['seq'] for msg in asyncio.run(main())], [1, 2, 3])
+
+    def test_appends_kept_in_seq_order_and_trimmed(self):
+        async def main():
+            cache = LocalHistoryCache(size=3, max_rooms=10)
+            await cache.fill(1, [{'seq': 1}, {'seq': 2}], await cache.generation(1))
+            await cache.append(1, {'seq': 4})
+            await cache.append(1, {'seq': 3})
+            await cache.append(1, {'seq': 4, 'id': 9})
+            return await cache.get_recent(1, 10)
+
+        recent = asyncio.run(main())
+        self.assertEqual([msg['seq'] for msg in recent], [2, 3, 4])
+        self.assertEqual(recent[-1]['id'], 9)
+
+    def test_invalidate_drops_room_and_refuses_older_fills(self):
+        async def main():
+            cache = LocalHistoryCache(size=10, max_rooms=10)
+            await cache.fill(1, [{'seq': 1}], await cache.generation(1))
+            generation = await cache.generation(1)
+            cache.invalidate([1])
+            self.assertIsNone(await cache.get_recent(1, 10))
+            # Read before the delete committed, so it may still hold the deleted rows
+            await cache.fill(1, [{'seq': 1}], generation)
+            return await cache.get_recent(1, 10)
+
+        self.assertIsNone(asyncio.run(main()))
+
+    def test_resolve_sets_write_behind_ids_and_seqs(self):
+        async def main():
+            cache = LocalHistoryCache(size=10, max_rooms=10)
+            await cache.fill(1, [{'id': 1, 'seq': 1}], await cache.generation(1))
+            await cache.append(1, {'id': None, 'seq': 2, 'write_id': 'a'})
+            await cache.append(1, {'id': None, 'seq': 3, 'write_id': 'b'})
+            # 'a' collided on flush and was stored under seq 4
+            await cache.resolve(1, [{'write_id': 'a', 'id': 7, 'seq': 4}, {'write_id': 'b', 'id': 6, 'seq': 3}])
+            return await cache.get_recent(1, 10)
+
+        self.assertEqual([(msg['id'], msg['seq']) for msg in asyncio.run(main())], [(1, 1), (6, 3), (7, 4)])
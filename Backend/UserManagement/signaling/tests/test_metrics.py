@@ -0,0 +1,43 @@
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from signaling import metrics
+
+
+class MetricsTests(SimpleTestCase):
+    """Test suite for the metrics registry and its Prometheus export"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_render_groups_series_by_type(self):
+        metrics.increment('chat_throttled_events_total', event='message', scope='user')
+        metrics.adjust_gauge('chat_outbound_queued_frames', 3)
+        metrics.observe('chat_db_execution_seconds', 0.5, pool='read')
+
+        self.assertEqual(metrics.render().splitlines(), [
+            '# TYPE chat_db_execution_seconds summary',
+            'chat_db_execution_seconds_count{pool="read"} 1',
+            'chat_db_execution_seconds_sum{pool="read"} 0.5',
+            '# TYPE chat_outbound_queued_frames gauge',
+            'chat_outbound_queued_frames 3',
+            '# TYPE chat_throttled_events_total counter',
+            'chat_throttled_events_total{event="message",scope="user"} 1',
+        ])
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_view_is_off_by_default(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN='')
+    def test_view_serves_prometheus_text(self):
+        metrics.increment('chat_slow_consumer_evictions_total')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'chat_slow_consumer_evictions_total 1', response.content)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN='scrape-secret')
+    def test_view_requires_token_when_set(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+from signaling.middleware import authenticate_token, get_scope_token, principal_cache
+from signaling.query_budget import QueryBudget
+import jwt
+
+User = get_user_model()
+
+
+class AuthenticateTokenTests(TransactionTestCase):
+    """Test suite for WebSocket JWT authentication"""
+
+    def setUp(self):
+        principal_cache.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='testpass123', name='Test User')
+
+    def _generate_jwt_token(self, user, expires_in=timedelta(hours=1)):
+        payload = {
+            'user_id': user.id,
+            'exp': datetime.utcnow() + expires_in,
+            'iat': datetime.utcnow()
+        }
+        return jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
+
+    def test_warm_cache_needs_no_queries(self):
+        token = self._generate_jwt_token(self.user)
+        # QueryBudget counts on whichever thread and connection the lookup runs
+        with QueryBudget(1, 'cold') as budget:
+            principal = async_to_sync(authenticate_token)(token)
+        self.assertEqual(len(budget.queries), 1)
+        self.assertEqual(principal.id, self.user.id)
+        self.assertEqual(principal.name, 'Test User')
+        self.assertTrue(principal.is_authenticated)
+
+        with QueryBudget(0, 'warm') as budget:
+            principal = async_to_sync(authenticate_token)(token)
+        self.assertEqual(len(budget.queries), 0)
+        self.assertEqual(principal.id, self.user.id)
+
+    def test_invalid_and_expired_tokens_rejected(self):
+        expired = self._generate_jwt_token(self.user, expires_in=timedelta(hours=-1))
+        self.assertIsNone(async_to_sync(authenticate_token)(expired))
+        self.assertIsNone(async_to_sync(authenticate_token)('invalid_token_xyz'))
+        self.assertIsNone(async_to_sync(authenticate_token)(None))
+
+    def test_get_scope_token(self):
+        scope = {'query_string': b'token=abc.def&since_id=10'}
+        self.assertEqual(get_scope_token(scope), 'abc.def')
+        self.assertIsNone(get_scope_token({'query_string': b''}))
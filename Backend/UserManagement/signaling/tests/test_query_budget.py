@@ -0,0 +1,49 @@
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, override_settings
+from User.models import Room
+from signaling import metrics
+from signaling.query_budget import QueryBudget, QueryBudgetExceeded, query_budget
+
+
+class QueryBudgetTests(TestCase):
+    """Test suite for the per-handler query budget"""
+
+    def setUp(self):
+        metrics.reset()
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict_budget_raises_when_exceeded(self):
+        with QueryBudget(2, 'rooms') as budget:
+            list(Room.objects.all())
+            Room.objects.count()
+        self.assertEqual(len(budget.queries), 2)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            with QueryBudget(1, 'rooms'):
+                list(Room.objects.all())
+                Room.objects.count()
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_lenient_budget_counts_and_logs(self):
+        with self.assertLogs('signaling.query_budget', level='WARNING'):
+            with QueryBudget(0, 'rooms'):
+                Room.objects.count()
+        self.assertEqual(metrics.snapshot()['counters']['query_budget_exceeded_total{name="rooms"}'], 1)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_async_handler_is_charged_for_executor_queries(self):
+        @query_budget(1)
+        async def handler():
+            await sync_to_async(Room.objects.count)()
+            await sync_to_async(Room.objects.count)()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            async_to_sync(handler)()
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_nested_budgets_charge_the_enclosing_block(self):
+        with QueryBudget(5, 'outer') as outer:
+            Room.objects.count()
+            with QueryBudget(1, 'inner'):
+                Room.objects.count()
+        self.assertEqual(len(outer.queries), 2)
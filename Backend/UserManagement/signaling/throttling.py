@@ -0,0 +1,75 @@
+# throttling.py
+import time
+from collections import OrderedDict
+from django.conf import settings
+from . import metrics
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self):
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate else None
+
+
+class RateLimiter:
+    """Per-user and per-room token buckets for each inbound event type.
+
+    Buckets live in this worker process, so with several Daphne workers
+    every worker enforces the configured rates on its own connections.
+    """
+
+    def __init__(self):
+        self.buckets = OrderedDict()
+
+    def get_bucket(self, key, rate, capacity):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate, capacity)
+            while len(self.buckets) > settings.CHAT_RATE_LIMIT_MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(key)
+        return bucket
+
+    def check(self, event_type, user_id, room_id):
+        """Consume one token from every applicable bucket.
+
+        Returns None when the event is allowed, otherwise (scope, retry_after)
+        for the first exhausted bucket - nothing is consumed in that case.
+        """
+        limits = settings.CHAT_RATE_LIMITS.get(event_type)
+        if not settings.CHAT_RATE_LIMIT_ENABLED or not limits:
+            return None
+
+        buckets = []
+        for scope, key in (('user', user_id), ('room', room_id)):
+            if scope not in limits:
+                continue
+            rate, capacity = limits[scope]
+            bucket = self.get_bucket((scope, key, event_type), rate, capacity)
+            bucket.refill()
+            if bucket.tokens < 1:
+                metrics.increment('chat_throttled_events_total', event=event_type, scope=scope)
+                return scope, bucket.retry_after()
+            buckets.append(bucket)
+
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return None
+
+    def clear(self):
+        self.buckets.clear()
+
+
+rate_limiter = RateLimiter()
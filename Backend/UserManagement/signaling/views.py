@@ -1,3 +1,25 @@
+import hmac
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from . import metrics
+
+
+def metrics_view(request):
+    """This worker's metrics registry for Prometheus to scrape.
+
+    Off unless METRICS_ENABLED; with METRICS_TOKEN set, scrapers must send
+    it as a bearer token. Each worker answers for itself only, see
+    metrics.render().
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()):
+            return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # from django.http import JsonResponse
 # from django.views.decorators.csrf import csrf_exempt
 # from django.utils.decorators import method_decorator
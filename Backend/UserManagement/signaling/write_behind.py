@@ -0,0 +1,366 @@
+# write_behind.py
+import asyncio
+import logging
+import time
+import uuid
+from functools import lru_cache
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from User.models import Message, Attachment, Room
+from . import metrics
+from .codecs import encode_broadcast, get_codec
+from .executor import get_db_executor
+from .history_cache import get_history_cache
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_last_seq(room_id):
+    return Room.objects.filter(id=room_id).values_list('last_seq', flat=True).first() or 0
+
+
+async def load_last_seq(room_id):
+    return await get_db_executor('read').run('load_last_seq', fetch_last_seq, room_id)
+
+
+class LocalSeqAllocator:
+    """In-process per-room counters seeded from Room.last_seq - single worker only"""
+
+    def __init__(self):
+        self.rooms = {}
+        self.seeding = {}
+
+    async def next(self, room_id):
+        if room_id not in self.rooms:
+            # Messages arriving together in a cold room wait for one seed
+            # instead of each loading last_seq and handing out the same number
+            async with self.seeding.setdefault(room_id, asyncio.Lock()):
+                if room_id not in self.rooms:
+                    self.rooms[room_id] = await load_last_seq(room_id)
+            self.seeding.pop(room_id, None)
+        self.rooms[room_id] += 1
+        return self.rooms[room_id]
+
+    async def forget(self, room_id):
+        """Reseed the room from Room.last_seq on its next message"""
+        self.rooms.pop(room_id, None)
+
+    async def clear(self):
+        self.rooms.clear()
+        self.seeding.clear()
+
+
+# SET key to ARGV[1] unless it already holds a larger number
+RAISE_TO_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return current
+"""
+
+
+class RedisSeqAllocator:
+    """Per-room INCR counters shared by all workers, seeded from Room.last_seq"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.seeded = set()
+
+    def key(self, room_id):
+        return f'chat:seq:{room_id}'
+
+    async def next(self, room_id):
+        if room_id not in self.seeded:
+            last_seq = await load_last_seq(room_id)
+            # Only ever raises the counter: another worker may already be handing out
+            # numbers for this room, or the key may have been lost and restarted low
+            await self.redis.eval(RAISE_TO_SCRIPT, 1, self.key(room_id), last_seq)
+            self.seeded.add(room_id)
+        return await self.redis.incr(self.key(room_id))
+
+    async def forget(self, room_id):
+        """Reseed the room from Room.last_seq on its next message"""
+        self.seeded.discard(room_id)
+
+    async def clear(self):
+        self.seeded.clear()
+        async for key in self.redis.scan_iter(match='chat:seq:*'):
+            await self.redis.delete(key)
+
+
+class RedisJournal:
+    """Redis stream of accepted-but-unpersisted messages.
+
+    Entries are appended before a message is broadcast and deleted once
+    its row is committed. Stream ids start with a millisecond timestamp,
+    so anything older than the reclaim window was left behind by a
+    worker that died before flushing and is replayed by the survivors.
+    """
+    key = 'chat:journal'
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def append(self, entry):
+        return (await self.redis.xadd(self.key, {'entry': get_codec().dumpb(entry)})).decode()
+
+    async def ack(self, journal_ids):
+        if journal_ids:
+            await self.redis.xdel(self.key, *journal_ids)
+
+    async def stale(self, older_than_ms, count):
+        cutoff = int(time.time() * 1000) - older_than_ms
+        items = await self.redis.xrange(self.key, '-', f'{cutoff}-0', count=count)
+        codec = get_codec()
+        return [
+            {**codec.loads(fields[b'entry']), 'journal_id': journal_id.decode()}
+            for journal_id, fields in items
+        ]
+
+    async def clear(self):
+        await self.redis.delete(self.key)
+
+
+def persist_messages(entries):
+    """Insert a batch of queued messages and claim their attachments in one transaction.
+
+    Entries whose write_id is already stored are skipped, so replaying a
+    journal entry that did make it to the DB is harmless. An entry whose
+    (room, seq) is taken by a different message - the allocator lost its
+    count - is logged as an error and stored under a freshly allocated seq
+    rather than dropped. Every entry with a row gets its 'id' and final
+    'seq' set, for MessageWriter.announce. Returns (inserted, rooms whose
+    seqs collided).
+    """
+    with transaction.atomic():
+        write_ids = [uuid.UUID(entry['write_id']) for entry in entries if entry.get('write_id')]
+        existing = {
+            write_id: (message_id, seq) for write_id, message_id, seq in
+            Message.objects.filter(write_id__in=write_ids).values_list('write_id', 'id', 'seq')
+        }
+        pending = []
+        for entry in entries:
+            stored = existing.get(uuid.UUID(entry['write_id'])) if entry.get('write_id') else None
+            if stored:
+                entry['id'], entry['seq'] = stored
+            else:
+                pending.append(entry)
+        entries = pending
+        if not entries:
+            return 0, set()
+
+        keys = Q()
+        for entry in entries:
+            keys |= Q(room_id=entry['room_id'], seq=entry['seq'])
+        taken = dict(
+            ((room_id, seq), write_id) for room_id, seq, write_id in
+            Message.objects.filter(keys).values_list('room_id', 'seq', 'write_id')
+        )
+
+        accepted, collided = [], []
+        for entry in entries:
+            key = (entry['room_id'], entry['seq'])
+            if key not in taken:
+                taken[key] = entry.get('write_id')
+                accepted.append(entry)
+            elif not entry.get('write_id') and taken[key] is None:
+                # Journal entry from before write ids existed: (room, seq) is all we have
+                continue
+            else:
+                collided.append(entry)
+
+        rooms = {}
+        for entry in accepted:
+            count, last_seq = rooms.get(entry['room_id'], (0, 0))
+            rooms[entry['room_id']] = (count + 1, max(last_seq, entry['seq']))
+        for room_id, (count, last_seq) in rooms.items():
+            Room.objects.filter(id=room_id).update(
+                message_count=F('message_count') + count,
+                last_seq=Greatest(F('last_seq'), last_seq)
+            )
+
+        for entry in collided:
+            logger.error(
+                f"Write-behind seq {entry['seq']} in room {entry['room_id']} is already taken; "
+                f"storing the message under a new seq"
+            )
+            metrics.increment('chat_write_behind_seq_collisions_total')
+            entry['seq'] = Room.allocate_seq(entry['room_id'])
+            Room.objects.filter(id=entry['room_id']).update(message_count=F('message_count') + 1)
+        entries = accepted + collided
+
+        # bulk_create skips User.signals, so the room counters are bumped above
+        messages = Message.objects.bulk_create([
+            Message(
+                room_id=entry['room_id'],
+                sender_id=entry['sender_id'],
+                message=entry['message'],
+                sender_type='user',
+                seq=entry['seq'],
+                write_id=entry.get('write_id')
+            )
+            for entry in entries
+        ])
+
+        for message, entry in zip(messages, entries):
+            entry['id'] = message.id
+            if entry['attachment_ids']:
+                Attachment.objects.filter(
+                    id__in=entry['attachment_ids'],
+                    room_id=entry['room_id'],
+                    uploaded_by_id=entry['sender_id'],
+                    message__isnull=True
+                ).update(message=message)
+    return len(entries), {entry['room_id'] for entry in collided}
+
+
+class MessageWriter:
+    """Write-behind pipeline for chat messages.
+
+    ChatConsumer takes a sequence number from the allocator, hands the
+    message to submit() and broadcasts right away; pending messages are
+    written with bulk_create every `interval` seconds, `batch_size` at a
+    time. With a journal, submit() only returns once the message is in
+    the Redis stream, so a worker crash loses nothing that was broadcast.
+    Without one, messages queued in a crashed worker are lost.
+
+    While enabled, ChatConsumer must be the only writer of chat messages:
+    rows created elsewhere take their seq from Room.last_seq, which only
+    catches up with the allocator when a batch is flushed.
+    """
+
+    def __init__(self, allocator, journal, interval, batch_size, reclaim_ms):
+        self.allocator = allocator
+        self.journal = journal
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reclaim_ms = reclaim_ms
+        self.pending = []
+        self.flusher = None
+        self.last_reclaim = 0
+
+    async def allocate_seq(self, room_id):
+        return await self.allocator.next(room_id)
+
+    async def submit(self, entry):
+        # Stored on the row: how a replayed journal entry is told apart from a seq collision
+        entry.setdefault('write_id', uuid.uuid4().hex)
+        if self.journal:
+            entry['journal_id'] = await self.journal.append(entry)
+        self.pending.append(entry)
+        metrics.adjust_gauge('chat_write_behind_pending', 1)
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.interval)
+        await self.flush()
+
+    async def flush(self):
+        while self.pending:
+            batch = self.pending[:self.batch_size]
+            if not await self.persist(batch):
+                # Keep them queued and try again next interval
+                self.flusher = asyncio.ensure_future(self.flush_later())
+                return
+            del self.pending[:len(batch)]
+            metrics.adjust_gauge('chat_write_behind_pending', -len(batch))
+
+        if self.journal and time.monotonic() - self.last_reclaim >= self.reclaim_ms / 1000:
+            self.last_reclaim = time.monotonic()
+            await self.reclaim()
+
+    async def persist(self, batch):
+        started = time.monotonic()
+        try:
+            inserted, collided = await get_db_executor('write').run('persist_messages', persist_messages, batch)
+            for room_id in collided:
+                # The allocator is behind the table; make it catch up before handing out more
+                await self.allocator.forget(room_id)
+            if self.journal:
+                await self.journal.ack([entry['journal_id'] for entry in batch])
+        except Exception as e:
+            logger.info(f"Write-behind flush failed: {e}")
+            metrics.increment('chat_write_behind_failures_total')
+            return False
+        await self.announce(batch)
+        metrics.increment('chat_write_behind_flushes_total')
+        metrics.increment('chat_write_behind_messages_total', inserted)
+        metrics.set_gauge('chat_write_behind_last_flush_seconds', time.monotonic() - started)
+        return True
+
+    async def announce(self, batch):
+        """Send each room a messages_stored frame mapping write ids to row ids and final seqs.
+
+        The chat_message frames went out with 'id': None, and with the
+        allocator's seq, which a collision may have changed. Clients and the
+        history cache match on write_id and correct their copies.
+        """
+        rooms = {}
+        for entry in batch:
+            if entry.get('id') is not None and entry.get('write_id'):
+                rooms.setdefault(entry['room_id'], []).append(
+                    {'write_id': entry['write_id'], 'id': entry['id'], 'seq': entry['seq']}
+                )
+        history_cache = get_history_cache()
+        for room_id, stored in rooms.items():
+            try:
+                if history_cache:
+                    await history_cache.resolve(room_id, stored)
+                await get_channel_layer().group_send(f'chat_{room_id}', {
+                    'type': 'messages_stored',
+                    **encode_broadcast({'type': 'messages_stored', 'messages': stored})
+                })
+            except Exception as e:
+                logger.info(f"Write-behind announce failed: {e}")
+
+    async def reclaim(self):
+        """Persist journal entries abandoned by dead workers"""
+        try:
+            stale = await self.journal.stale(self.reclaim_ms, self.batch_size)
+        except Exception as e:
+            logger.info(f"Write-behind journal read failed: {e}")
+            return
+        if stale and await self.persist(stale):
+            metrics.increment('chat_write_behind_reclaimed_total', len(stale))
+
+    async def clear(self):
+        if self.flusher:
+            self.flusher.cancel()
+        self.flusher = None
+        metrics.adjust_gauge('chat_write_behind_pending', -len(self.pending))
+        self.pending.clear()
+        await self.allocator.clear()
+        if self.journal:
+            await self.journal.clear()
+
+
+@lru_cache(maxsize=None)
+def load_message_writer(backend, url, durability, interval_ms, batch_size, reclaim_ms):
+    if backend == 'redis':
+        import redis.asyncio as redis
+        client = redis.Redis.from_url(url)
+        allocator = RedisSeqAllocator(client)
+        journal = RedisJournal(client) if durability == 'journal' else None
+    else:
+        allocator = LocalSeqAllocator()
+        journal = None
+    return MessageWriter(allocator, journal, interval_ms / 1000, batch_size, reclaim_ms)
+
+
+def get_message_writer():
+    """Write-behind pipeline, or None when CHAT_WRITE_BEHIND_ENABLED is off (synchronous saves)"""
+    if not settings.CHAT_WRITE_BEHIND_ENABLED:
+        return None
+    return load_message_writer(
+        settings.CHAT_WRITE_BEHIND_BACKEND,
+        settings.CHAT_WRITE_BEHIND_URL,
+        settings.CHAT_WRITE_BEHIND_DURABILITY,
+        settings.CHAT_WRITE_BEHIND_INTERVAL_MS,
+        settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+        settings.CHAT_WRITE_BEHIND_RECLAIM_MS,
+    )
@@ -36,7 +36,7 @@ export default function MessagesContainer({
           </div>
         ) : (
           messages.map((msg) => (
-            <div key={msg.id}>
+            <div key={msg.writeId ?? msg.id}>
               <MessageBubble
                 msg={msg}
                 isOwn={msg.username === username}
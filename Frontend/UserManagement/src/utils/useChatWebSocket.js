@@ -27,6 +27,8 @@ export const useChatWebSocket = (roomId, token, initialUsername) => {
   const formatMessages = useCallback((msgs) => {
     return msgs.map((msg) => ({
       id: msg.id,
+      // Set on write-behind messages, whose id stays null until messages_stored
+      writeId: msg.write_id,
       username: msg.sender_name,
       message: msg.message,
       media: msg.media || [],
@@ -115,6 +117,7 @@ export const useChatWebSocket = (roomId, token, initialUsername) => {
               ...prev,
               {
                 id: data.id,
+                writeId: data.write_id,
                 username: data.username,
                 message: data.message,
                 media: data.media || [],
@@ -122,6 +125,14 @@ export const useChatWebSocket = (roomId, token, initialUsername) => {
                 timestamp: new Date(data.timestamp).toLocaleTimeString(),
               },
             ]);
+          } else if (data.type === "messages_stored") {
+            // Write-behind flush: fill in the row ids of messages broadcast with id null
+            const stored = new Map(data.messages.map((item) => [item.write_id, item.id]));
+            setMessages((prev) =>
+              prev.map((msg) =>
+                msg.writeId && stored.has(msg.writeId) ? { ...msg, id: stored.get(msg.writeId) } : msg
+              )
+            );
           } else if (data.type === "token_refreshed") {
             accessTokenRef.current = data.access_token;
             console.log("Token refreshed successfully via WebSocket");
@@ -134,6 +145,10 @@ export const useChatWebSocket = (roomId, token, initialUsername) => {
             console.log("WebSocket connection established");
           } else if (data.type === "user_join" || data.type === "user_leave") {
             console.log(data.message);
+          } else if (data.type === "presence_delta") {
+            // Coalesced joins/leaves (CHAT_PRESENCE_WINDOW_MS > 0 on the server)
+            data.joined.forEach((user) => console.log(`${user.user_name} joined the chat`));
+            data.left.forEach((user) => console.log(`${user.user_name} left the chat`));
           }
         } catch (error) {
           console.error("Error parsing message:", error);